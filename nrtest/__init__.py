@@ -3,6 +3,7 @@
 # system imports
 import os.path
 import logging
+import threading
 from functools import total_ordering
 
 # third-party imports
@@ -21,25 +22,42 @@ class Metadata(dict):
     execute_required_fields = []
     execute_optional_fields = {}
     compare_required_fields = []
+    compare_optional_fields = {}
 
-    def __init__(self, *args, **kwargs):
-        super(Metadata, self).__init__(*args, **kwargs)
-        self.__dict__ = self
+    # no per-instance __dict__, so that large testsuites are compact
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
 
     def skim(self):
-        return {k: self.get(k, None) for k in self.compare_required_fields}
+        fields = list(self.compare_required_fields)
+        fields.extend(self.compare_optional_fields)
+        return {k: self.get(k, None) for k in fields}
 
     @classmethod
     def for_execution(cls, data):
         req, opt = cls.execute_required_fields, cls.execute_optional_fields
         cls._validate(data, req, opt)
-        return cls(**data)
+        return cls(_intern_keys(data))
 
     @classmethod
     def for_comparison(cls, data):
-        req, opt = cls.compare_required_fields, {}
+        req, opt = cls.compare_required_fields, cls.compare_optional_fields
         cls._validate(data, req, opt)
-        return cls(**data)
+        return cls(_intern_keys(data))
 
     @staticmethod
     def _validate(data, required, allowed):
@@ -62,6 +80,13 @@ class Metadata(dict):
         return self.name < other.name
 
 
+def _intern_keys(data):
+    """Interns the field names, so that they are shared by all instances
+    instead of being duplicated by the JSON parser.
+    """
+    return ((six.moves.intern(str(k)), v) for k, v in six.iteritems(data))
+
+
 class Application(Metadata):
     """When declaring the application in a JSON file...
 
@@ -74,6 +99,8 @@ class Application(Metadata):
     Optional fields:
         description
         timeout [float in secs]
+        sample_interval: time between performance measurements [float in secs]
+        max_samples: maximum number of performance measurements stored [int]
     """
     execute_required_fields = [
         'name',
@@ -84,6 +111,8 @@ class Application(Metadata):
         'description': None,
         'setup_script': None,
         'timeout': None,
+        'sample_interval': None,
+        'max_samples': None,
     }
     compare_required_fields = [
         'name',
@@ -91,6 +120,8 @@ class Application(Metadata):
         'description',
     ]
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super(Application, self).__init__(*args, **kwargs)
         if hasattr(self, 'setup_script') and self.setup_script is not None:
@@ -109,8 +140,12 @@ class Test(Metadata):
     Optional fields:
         description
         input_files [list of paths]
+        input_staging: method used to stage input files [string]
         output_files [dict of paths and result types]
         fail_strings: list of strings indicating failure in log file
+        memory_MB: expected peak memory usage [MB]
+        repeat: number of times to execute the test [int]
+        warmup: number of additional runs to discard [int]
     """
     execute_required_fields = [
         'name',
@@ -121,8 +156,12 @@ class Test(Metadata):
         'description': None,
         'minimum_app_version': None,
         'input_files': [],
+        'input_staging': None,
         'output_files': {},
         'fail_strings': [],
+        'memory_MB': None,
+        'repeat': None,
+        'warmup': None,
     }
     compare_required_fields = [
         'name',
@@ -132,11 +171,18 @@ class Test(Metadata):
         'passed',
         'error_msg',
     ]
+    compare_optional_fields = {
+        'fingerprint': None,
+        'reused_from': None,
+        'output_hashes': None,
+    }
 
     out_fname = 'stdout.log'
     err_fname = 'stderr.log'
     perf_fname = 'performance.json'
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super(Test, self).__init__(*args, **kwargs)
 
@@ -144,10 +190,31 @@ class Test(Metadata):
             if ftype is None:
                 self.output_files[fname] = 'null'
 
-        self.logger = logging.getLogger(self.name)
-        if not self.logger.handlers:
-            formatter = logging.Formatter('%(name)s: %(message)s')
+    @property
+    def logger(self):
+        """Logger whose messages are prefixed by the name of the test. All
+        tests share a single underlying logger.
+        """
+        return logging.LoggerAdapter(get_test_logger(), {'test': self.name})
+
+
+_test_logger = None
+_test_logger_lock = threading.Lock()
+
+
+def get_test_logger():
+    """Returns the logger shared by all tests, which is created on first use.
+    Its records have a "test" attribute, containing the name of the test.
+    """
+    global _test_logger
+    with _test_logger_lock:
+        if _test_logger is None:
+            logger = logging.getLogger('nrtest.tests')
+            formatter = logging.Formatter('%(test)s: %(message)s')
             handler = logging.StreamHandler()
             handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
-            self.logger.propagate = False
+            logger.addHandler(handler)
+            logger.propagate = False
+            _test_logger = logger
+
+    return _test_logger
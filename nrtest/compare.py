@@ -10,20 +10,37 @@ import six
 
 # project imports
 from .utility import color
-from .plugin import find_unique_function
+from .plugin import find_unique_function, register
 
 
 class CompareException(Exception):
     pass
 
 
-def compare_testsuite(ts_sut, ts_ref, rtol, atol, outfile):
+# Absolute increase in each performance metric that is never considered a
+# regression, in order to ignore noise in short or small tests.
+perf_atol_defaults = {
+    'duration': 1.0,
+    'max_memory_MB': 10.0,
+    'io_MB': 10.0,
+}
+
+
+def compare_testsuite(ts_sut, ts_ref, rtol, atol, outfile,
+                      perf_rtol=None, perf_atol=None, jobs=1, stats=False):
     """Compare the results of a testsuite against a benchmark.
 
     Args:
         ts_sut: SUT testsuite
         ts_ref: benchmark testsuite
         tolerance: relative precision at which results considered compatible
+        perf_rtol: relative increase in duration, peak memory or I/O that is
+            considered a regression (if None, performance is not compared)
+        perf_atol: dict of absolute increases in each performance metric that
+            are not considered a regression (see perf_atol_defaults)
+        jobs: number of processes that compare files concurrently
+        stats: compare every result file of each test and record the
+            statistics of the differences (see compare_test)
 
     Returns: boolean compatibility
     """
@@ -45,13 +62,33 @@ def compare_testsuite(ts_sut, ts_ref, rtol, atol, outfile):
         'Tests': [],
     }
 
+    unknown = set(perf_atol or {}) - set(perf_atol_defaults)
+    if unknown:
+        raise ValueError('Unknown performance metrics: %s'
+                         % ', '.join(sorted(unknown)))
+
+    if perf_rtol is not None:
+        perf_atol = dict(perf_atol_defaults, **(perf_atol or {}))
+        receipt['PerformanceTolerance'] = {
+            'relative': perf_rtol,
+            'absolute': perf_atol,
+        }
+
     # compare all tests and return False if any are incompatible
+    names = sorted(common_test_names)
+    if jobs > 1:
+        pairs = [(tests_sut[name], tests_ref[name]) for name in names]
+        diffs = _compare_files_parallel(pairs, rtol, atol, jobs)
+    else:
+        diffs = (None for name in names)
+
     compatible = True
-    for name in sorted(common_test_names):
+    for name, diff in zip(names, diffs):
         test_sut = tests_sut[name]
         test_ref = tests_ref[name]
 
-        comparison = compare_test(test_sut, test_ref, rtol, atol)
+        comparison = compare_test(test_sut, test_ref, rtol, atol,
+                                  perf_rtol, perf_atol, diff, stats)
         receipt['Tests'].append(comparison)
 
         if not comparison['passed']:
@@ -65,17 +102,26 @@ def compare_testsuite(ts_sut, ts_ref, rtol, atol, outfile):
     return compatible
 
 
-def compare_test(test_sut, test_ref, rtol, atol):
+def compare_test(test_sut, test_ref, rtol, atol, perf_rtol=None,
+                 perf_atol=None, diff=None, stats=False):
     """Compare the results of a single test against a benchmark.
 
     Args:
         test_sut: SUT test
         test_ref: benchmark test
         tolerance: relative precision at which results considered compatible
-
-    Returns: boolean compatibility
+        perf_rtol, perf_atol: tolerances of performance regressions (see
+            compare_testsuite)
+        diff: dict of results of file comparisons that have already been
+            made (see _compare_file). Other files are compared here.
+        stats: compare every result file, rather than stopping at the first
+            incompatible file, and record the outcome of each comparison and
+            any statistics of the differences returned by the comparison
+            function in the "files" field
+
+    Returns: dict describing the comparison
     """
-    logger = logging.getLogger(test_sut.name)
+    logger = test_sut.logger
 
     comparison = {
         'name': test_sut.name,
@@ -83,8 +129,9 @@ def compare_test(test_sut, test_ref, rtol, atol):
         'passed': None,
         'error_msg': None,
     }
+    if stats:
+        comparison['files'] = {}
 
-    compatible = True
     try:
         # check tests are comparable
         if test_sut.name != test_ref.name:
@@ -95,10 +142,11 @@ def compare_test(test_sut, test_ref, rtol, atol):
             raise CompareException('Benchmark has different output files')
 
         # compare result files
-        # return False immediately if any are incompatible
+        # return False immediately if any are incompatible, unless collecting
+        # statistics of every file
+        failures = []
         for fname, ftype in six.iteritems(test_sut.output_files):
 
-            ftype = ftype.lower()
             path_sut = os.path.join(test_sut.output_dir, fname)
             path_ref = os.path.join(test_ref.output_dir, fname)
 
@@ -107,14 +155,53 @@ def compare_test(test_sut, test_ref, rtol, atol):
             if not os.path.exists(path_ref):
                 raise CompareException('Output file not found: %s' % path_ref)
 
-            compare_file = find_unique_function('compare', ftype)
-            try:
-                compatible = compare_file(path_sut, path_ref, rtol, atol)
-            except Exception as e:
-                raise CompareException('Exception raised during diff: %s' % e)
-
-            if not compatible:
-                raise CompareException('%s: diff failed' % fname)
+            if _identical(test_sut, test_ref, fname):
+                if stats:
+                    comparison['files'][fname] = {'passed': True,
+                                                  'identical': True}
+                continue
+
+            if diff is not None and fname in diff:
+                result, error = diff[fname]
+            else:
+                args = (ftype, path_sut, path_ref, rtol, atol)
+                result, error = _compare_file(args)
+
+            # comparison functions return a boolean or a dict of statistics
+            if isinstance(result, dict):
+                details, passed = result, bool(result.get('passed'))
+            else:
+                details, passed = {}, bool(result)
+            if stats:
+                comparison['files'][fname] = dict(details, passed=passed,
+                                                  error_msg=error)
+
+            msg = None
+            if error is not None:
+                msg = 'Exception raised during diff: %s' % error
+            elif not passed:
+                msg = '%s: diff failed' % fname
+
+            if msg is not None:
+                if not stats:
+                    raise CompareException(msg)
+                failures.append(msg)
+
+        if failures:
+            raise CompareException('; '.join(failures))
+
+        # compare performance
+        if perf_rtol is not None:
+            perf_atol = dict(perf_atol_defaults, **(perf_atol or {}))
+            perf = compare_performance(test_sut, test_ref, perf_rtol,
+                                       perf_atol)
+            comparison['performance'] = perf
+
+            regressions = [_describe_change(k, v)
+                           for k, v in sorted(perf.items()) if v['regressed']]
+            if regressions:
+                msg = 'Performance regression: %s' % ', '.join(regressions)
+                raise CompareException(msg)
 
     except CompareException as e:
         comparison['passed'] = False
@@ -123,12 +210,191 @@ def compare_test(test_sut, test_ref, rtol, atol):
         logger.info(str(e))
 
     else:
-        comparison['passed'] = compatible
+        comparison['passed'] = True
         logger.info(color('pass', 'g'))
 
     return comparison
 
 
+def _compare_file(args):
+    """Compares a result file to its reference file. This is called by worker
+    processes, so it takes a single picklable argument.
+
+    Args:
+        args: tuple of (file type, path to SUT file, path to benchmark file,
+            relative tolerance, absolute tolerance)
+
+    Returns: tuple of (value returned by the comparison, i.e. boolean
+        compatibility or dict of statistics including "passed", and message of
+        the exception raised by the comparison or None)
+    """
+    ftype, path_sut, path_ref, rtol, atol = args
+    ftype, spec = split_file_type(ftype)
+    compare_file = find_unique_function('compare', ftype)
+    try:
+        if spec is None:
+            return compare_file(path_sut, path_ref, rtol, atol), None
+        return compare_file(path_sut, path_ref, rtol, atol, spec), None
+    except Exception as e:
+        return False, str(e)
+
+
+def split_file_type(ftype):
+    """Splits a file type into the name of the comparison and an optional
+    specification that is passed to the comparison function as an extra
+    argument, e.g. "raw:<f8" is split into ("raw", "<f8").
+
+    Returns: tuple of (lowercase name, specification or None)
+    """
+    name, _, spec = ftype.partition(':')
+    return name.lower(), spec or None
+
+
+def _file_tasks(test_sut, test_ref, rtol, atol):
+    """Returns the file comparisons needed by compare_test(), as a list of
+    (file name, arguments of _compare_file).
+    """
+    if (test_sut.name != test_ref.name or
+            test_sut.output_files.keys() != test_ref.output_files.keys()):
+        return []
+
+    tasks = []
+    for fname, ftype in six.iteritems(test_sut.output_files):
+        path_sut = os.path.join(test_sut.output_dir, fname)
+        path_ref = os.path.join(test_ref.output_dir, fname)
+        if (os.path.exists(path_sut) and os.path.exists(path_ref) and
+                not _identical(test_sut, test_ref, fname)):
+            args = (ftype, path_sut, path_ref, rtol, atol)
+            tasks.append((fname, args))
+
+    return tasks
+
+
+def _identical(test_sut, test_ref, fname):
+    """Returns whether the hashes recorded when a result file and its
+    reference file were created are equal, in which case the files are
+    identical and need not be compared.
+    """
+    h_sut = (test_sut.get('output_hashes') or {}).get(fname)
+    h_ref = (test_ref.get('output_hashes') or {}).get(fname)
+    return h_sut is not None and h_sut == h_ref
+
+
+def _compare_files_parallel(pairs, rtol, atol, jobs):
+    """Compares the result files of pairs of tests in a pool of worker
+    processes. Every file is compared, so a test might be found incompatible
+    by a different file than in a serial comparison, which stops at the
+    first incompatible file. However compare_test() uses the first
+    incompatible file in the same order, so the outcome is identical.
+
+    Args:
+        pairs: list of (SUT test, benchmark test)
+        rtol, atol: tolerances
+        jobs: number of worker processes
+
+    Returns: generator of the results of the file comparisons of each pair
+        (see compare_test), in the same order
+    """
+    import multiprocessing
+
+    tasks = [_file_tasks(t_sut, t_ref, rtol, atol) for t_sut, t_ref in pairs]
+
+    # the comparison functions are resolved once and passed to the workers
+    ftypes = set(split_file_type(args[0])[0] for ts in tasks for _, args in ts)
+    functions = {ft: find_unique_function('compare', ft) for ft in ftypes}
+
+    pool = multiprocessing.Pool(jobs, _register_functions, (functions,))
+    try:
+        results = pool.imap(_compare_file,
+                            (args for ts in tasks for _, args in ts))
+        for ts in tasks:
+            yield {fname: next(results) for fname, _ in ts}
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _register_functions(functions):
+    for ftype, function in functions.items():
+        register('compare', ftype, function)
+
+
+def compare_performance(test_sut, test_ref, rtol, atol):
+    """Compare the performance of a single test against a benchmark. A metric
+    has regressed if it increased by more than both the relative tolerance
+    and its absolute tolerance.
+
+    Args:
+        test_sut: SUT test
+        test_ref: benchmark test
+        rtol: relative tolerance
+        atol: dict of absolute tolerance of each metric
+
+    Returns: dict mapping each metric to its values in both tests, relative
+        change (None for an increase from zero) and whether it has regressed. Metrics that are not available
+        in both tests are omitted.
+    """
+    perf_sut = read_performance(test_sut)
+    perf_ref = read_performance(test_ref)
+
+    comparison = {}
+    for metric, tol in sorted(atol.items()):
+        new, old = perf_sut.get(metric), perf_ref.get(metric)
+        if new is None or old is None:
+            continue
+
+        # the relative change from zero is undefined (i.e. None)
+        if old > 0:
+            change = (new - old) / old
+        else:
+            change = None if new > old else 0.0
+        comparison[metric] = {
+            'new': new,
+            'old': old,
+            'change': change,
+            'regressed': new - old > tol and new - old > rtol * old,
+        }
+
+    return comparison
+
+
+def _describe_change(metric, v):
+    """Describes the change in a performance metric, which is relative unless
+    the reference value is zero.
+    """
+    if v['old'] > 0:
+        return '%s +%.0f%%' % (metric, 100. * v['change'])
+    return '%s +%g (from 0)' % (metric, v['new'] - v['old'])
+
+
+def read_performance(test):
+    """Reads the performance metrics of a test from its performance.json file.
+    Returns an empty dict if this is not found (e.g. the test failed).
+    """
+    p = os.path.join(test.output_dir, test.perf_fname)
+    try:
+        with open(p) as f:
+            perf = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+    # older versions stored a time series of cumulative I/O
+    io = 0.0
+    for k in ['read_MB', 'write_MB']:
+        v = perf.get(k)
+        if isinstance(v, list):
+            v = v[-1] if v else None
+        if v is not None:
+            io += v
+
+    return {
+        'duration': perf.get('duration'),
+        'max_memory_MB': perf.get('max_memory_MB'),
+        'io_MB': io if 'read_MB' in perf else None,
+    }
+
+
 def validate_testsuite(ts):
     """Validates the presence of files and directories needed for compare
     commands.
@@ -138,8 +404,7 @@ def validate_testsuite(ts):
         logging.error('Benchmark directory not found: "%s"' % p)
         return False
 
-    p = os.path.join(ts.benchmark_path, ts.manifest_fname)
-    if not os.path.exists(p):
+    if ts.find_manifest(p) is None:
         logging.error('Benchmark manifest not found: "%s"' % p)
         return False
 
@@ -147,7 +412,8 @@ def validate_testsuite(ts):
         if not validate_test(t):
             return False
 
-    file_types = set(ft for t in ts.tests for ft in t.output_files.values())
+    file_types = set(split_file_type(ft)[0]
+                     for t in ts.tests for ft in t.output_files.values())
     for ft in file_types:
         if find_unique_function('compare', ft) is None:
             return False
@@ -156,7 +422,7 @@ def validate_testsuite(ts):
 
 
 def validate_test(test):
-    logger = logging.getLogger(test.name)
+    logger = test.logger
 
     # not specified by user, but should be set by now
     additional_required_fields = [
@@ -2,40 +2,210 @@
 
 # system imports
 import os
+import re
 import logging
 import tempfile
 import json
+import hashlib
 import datetime
+import threading
+from contextlib import contextmanager
+from subprocess import PIPE
 
 # third-party imports
+import psutil
 from packaging import version
 
 # project imports
-from .process import source, execute, monitor
-from .utility import color, copy_file_and_path, rmtree, which
+from . import get_test_logger
+from .process import cached_source, execute, monitor, OutputScanner
+from .schedule import order_tests, expected_memory, run_concurrently
+from .stats import describe
+from .utility import color, move_file_and_path, stage_file, rmtree, which
+from .utility import link_tree, hash_file, cache_dir, write_json_atomic
+from .utility import STAGING_METHODS
 
 
 class TestFailure(Exception):
     pass
 
 
-def execute_testsuite(ts):
+def execute_testsuite(ts, jobs=1, history=None, memory_limit=None,
+                      staging='copy', reuse=None, repeat=1, warmup=0,
+                      resume=False):
+    """Execute each test in a testsuite.
+
+    Args:
+        ts: testsuite
+        jobs: maximum number of tests to execute concurrently
+        history: performance data from a previous benchmark, used to execute
+            the longest tests first and to estimate their memory usage
+        memory_limit: memory available to concurrent tests [MB], which
+            defaults to the memory currently available on the machine
+        staging: method used to stage input files in the working directory,
+            unless specified by the test (see utility.stage_file)
+        reuse: testsuite of a previous benchmark, whose results are reused
+            for tests that have not changed since
+        repeat: number of times to execute each test, unless specified by the
+            test, in order to obtain robust performance statistics
+        warmup: number of additional runs of each test, unless specified by
+            the test, whose performance is discarded
+        resume: skip tests recorded in the journal of the benchmark, which
+            finished before execution was interrupted
+
+    Returns: boolean success
+    """
+    if repeat < 1 or warmup < 0:
+        raise ValueError('Invalid repeat or warmup: %s, %s' % (repeat, warmup))
+
+    history = history or {}
+    references = {t.name: t for t in reuse.tests} if reuse else {}
+
+    # skip tests that finished before execution was interrupted
     success = True
+    tests = []
+    finished = ts.read_journal() if resume else {}
+    env = _environment(ts.app) if finished else None
     for test in ts.tests:
-        if not execute_test(test, ts.app):
+        if _restore(test, finished.get(test.name), ts.app, env):
+            logging.debug('Skipping finished test: "%s"' % test.name)
+            success = success and test.passed
+        else:
+            tests.append(test)
+
+    tests = order_tests(tests, history)
+
+    def run(test):
+        passed = execute_test(test, ts.app, staging,
+                              references.get(test.name), repeat, warmup)
+        ts.append_journal(test)
+        return passed
+
+    if jobs > 1:
+        if memory_limit is None:
+            memory_limit = psutil.virtual_memory().available / 1024. / 1024.
+        memory = {t.name: expected_memory(t, history) for t in tests}
+        return _execute_parallel(run, tests, jobs, memory_limit,
+                                 memory) and success
+
+    for test in tests:
+        if not run(test):
             success = False
 
     return success
 
 
-def execute_test(test, app):
-    logger = logging.getLogger(test.name)
+def _restore(test, record, app, env):
+    """Restores the outcome of a test from its journal record, if the test is
+    unchanged (i.e. has the same fingerprint) and its results are still
+    present.
 
-    if not os.path.exists(test.output_dir):
-        os.makedirs(test.output_dir)
+    Returns: boolean success
+    """
+    if (record is None or record['version'] != test.version or
+            record['output_files'] != test.output_files or
+            not os.path.isdir(test.output_dir)):
+        return False
+
+    fingerprint = record.get('fingerprint')
+    if fingerprint is None or fingerprint != _fingerprint(test, app, env):
+        return False
+
+    for k in ['passed', 'error_msg', 'fingerprint', 'reused_from',
+              'output_hashes']:
+        test[k] = record.get(k)
+    return True
+
+
+def _execute_parallel(func, tests, jobs, memory_limit, memory):
+    """Execute tests concurrently, each in its own thread. Each test runs in
+    its own working directory, so the only shared resource is the terminal.
+    Log messages are therefore held back until a test has finished.
+    """
+    def run(test):
+        with _grouped_log():
+            return func(test)
+
+    results = run_concurrently(run, tests, jobs, memory_limit, memory)
+    return all(results)
+
+
+class _BufferingFilter(logging.Filter):
+    """Holds back the records emitted by threads that have a buffer, instead of
+    letting them through.
+    """
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self.buffers = {}
+
+    def filter(self, record):
+        buf = self.buffers.get(record.thread)
+        if buf is None:
+            return True
+        buf.append(record)
+        return False
 
+
+_log_lock = threading.Lock()
+_log_filter = None
+
+
+@contextmanager
+def _grouped_log():
+    """Buffers the test messages emitted by the current thread and emits them
+    all at once on exit, so that they are grouped together in the output.
+    """
+    global _log_filter
+    logger = get_test_logger()
+    with _log_lock:
+        if _log_filter is None:
+            _log_filter = _BufferingFilter()
+            logger.addFilter(_log_filter)
+
+    thread, buf = threading.current_thread().ident, []
+    _log_filter.buffers[thread] = buf
     try:
-        duration = _execute(test, app)
+        yield
+    finally:
+        del _log_filter.buffers[thread]
+        with _log_lock:
+            for record in buf:
+                logger.handle(record)
+
+
+def execute_test(test, app, staging='copy', reference=None, repeat=1,
+                 warmup=0):
+    logger = test.logger
+
+    # clear any partial results, left by an interrupted execution
+    if os.path.exists(test.output_dir):
+        rmtree(test.output_dir)
+    os.makedirs(test.output_dir)
+
+    env = _environment(app)
+    test.fingerprint = _fingerprint(test, app, env)
+    test.reused_from = None
+    test.output_hashes = None
+
+    if reference and _reusable(test, reference):
+        link_tree(reference.output_dir, test.output_dir)
+        test.passed = True
+        test.error_msg = None
+        test.reused_from = reference.output_dir
+        test.output_hashes = reference.output_hashes
+        logger.info(color('pass', 'g') + ' (reused)')
+        return test.passed
+
+    # the test configuration overrides the defaults, even when zero
+    if test.repeat is not None:
+        repeat = test.repeat
+    if test.warmup is not None:
+        warmup = test.warmup
+
+    try:
+        duration = _execute_repeated(test, app, env,
+                                     test.input_staging or staging,
+                                     repeat, warmup)
         _postcheck(test)
     except TestFailure as e:
         test.passed = False
@@ -52,70 +222,260 @@ def execute_test(test, app):
     return test.passed
 
 
-def _execute(test, app):
+def _environment(app):
+    p = app.setup_script
+    return cached_source(p) if p else os.environ
+
+
+# environment variables that vary between shells without affecting tests
+_volatile_env = ['_', 'OLDPWD', 'PWD', 'SHLVL']
+
+# environment variables that determine which programs and libraries are run,
+# which are part of the fingerprint even if not set by the setup script
+_fingerprint_env = ['PATH', 'LD_LIBRARY_PATH', 'LD_PRELOAD',
+                    'DYLD_LIBRARY_PATH', 'PYTHONPATH', 'PYTHONHOME']
+
+
+def _fingerprint(test, app, env):
+    """Returns a hash of everything that determines the outcome of a test: the
+    test configuration, the contents of its input files, the application
+    version and executable, and the environment. Only the variables set or
+    changed by the setup script, and those in _fingerprint_env, are included,
+    so that variables specific to a shell or CI job do not prevent reuse.
+    """
+    names = set(_fingerprint_env)
+    if app.setup_script:
+        names.update(k for k in set(env) | set(os.environ)
+                     if env.get(k) != os.environ.get(k))
+    names.difference_update(_volatile_env)
+
+    fields = ['version', 'args', 'input_files', 'output_files',
+              'fail_strings']
+    data = {
+        'test': {k: test[k] for k in fields},
+        'inputs': {fname: _cached_hash(os.path.join(test.input_dir, fname))
+                   for fname in test.input_files},
+        'app': {k: app[k] for k in ['name', 'version', 'timeout']},
+        'exe': _cached_hash(which(app.exe, env)),
+        'env': {k: env.get(k) for k in names},
+    }
+
+    s = json.dumps(data, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(s).hexdigest()
+
+
+_hash_cache = {}
+
+
+def _cached_hash(p):
+    """Returns the hash of a file (see utility.hash_file), or None if it does
+    not exist. Hashes are cached in memory and on disk (see
+    utility.cache_dir), keyed by the path, inode, modification time and size
+    of the file, so that unchanged input files are not read again by later
+    invocations.
+    """
+    if not p or not os.path.isfile(p):
+        return None
+
+    st = os.stat(p)
+    mtime = getattr(st, 'st_mtime_ns', st.st_mtime)
+    key = [os.path.abspath(p), st.st_ino, mtime, st.st_size]
+    if tuple(key) in _hash_cache:
+        return _hash_cache[tuple(key)]
+
+    path, record = None, None
+    d = cache_dir('hashes')
+    if d is not None:
+        name = hashlib.sha1(key[0].encode('utf-8')).hexdigest()
+        path = os.path.join(d, name + '.json')
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+
+    if isinstance(record, list) and record[:4] == key:
+        h = record[4]
+    else:
+        h = hash_file(p)
+        if path is not None:
+            try:
+                write_json_atomic(path, key + [h])
+            except (IOError, OSError) as e:
+                logging.debug('Unable to cache hash: %s' % e)
+
+    _hash_cache[tuple(key)] = h
+    return h
+
+
+def _reusable(test, reference):
+    """Results of a previous benchmark can be reused if the test passed and
+    nothing has changed since.
+    """
+    return (reference.passed and reference.fingerprint is not None and
+            reference.fingerprint == test.fingerprint and
+            os.path.isdir(reference.output_dir))
+
+
+def _execute(test, app, env, staging):
+    logger = test.logger
+
     try:
         tmpdir = tempfile.mkdtemp()
     except OSError:
         raise TestFailure('Unable to open working directory')
 
     try:
-        # Copy input files to working directory
+        # Stage input files in working directory
+        staged = {}
         for fname in test.input_files:
-            copy_file_and_path(fname, test.input_dir, tmpdir)
+            staged[fname] = stage_file(fname, test.input_dir, tmpdir, staging)
+            if staged[fname] != staging:
+                logger.debug('Unable to %s input file, copied instead: "%s"'
+                             % (staging, fname))
 
         # Perform test
         cmd = ' '.join([app.exe] + test.args)
-        env = source(app.setup_script) if app.setup_script else os.environ
 
         try:
             p_out = os.path.join(test.output_dir, test.out_fname)
             p_err = os.path.join(test.output_dir, test.err_fname)
-            with open(p_out, 'w') as f_out:
-                with open(p_err, 'w') as f_err:
-
-                    proc = execute(cmd, env=env, cwd=tmpdir,
-                                   stdout=f_out, stderr=f_err)
-
-                    (exitcode, perf) = monitor(proc, timeout=app.timeout)
-                    dur = perf['duration']
+            with open(p_out, 'wb') as f_out:
+                with open(p_err, 'wb') as f_err:
+
+                    # If there are failure strings, the logs are scanned
+                    # whilst the test runs so that it can be killed early
+                    if test.fail_strings:
+                        proc = execute(cmd, env=env, cwd=tmpdir,
+                                       stdout=PIPE, stderr=PIPE)
+                        pattern = _fail_pattern(test.fail_strings)
+                        scanners = {
+                            test.out_fname: OutputScanner(proc, proc.stdout,
+                                                          f_out, pattern),
+                            test.err_fname: OutputScanner(proc, proc.stderr,
+                                                          f_err, pattern),
+                        }
+                        for scanner in scanners.values():
+                            scanner.start()
+                    else:
+                        proc = execute(cmd, env=env, cwd=tmpdir,
+                                       stdout=f_out, stderr=f_err)
+                        scanners = {}
+
+                    (exitcode, perf) = monitor(proc, timeout=app.timeout,
+                                               **_sampling(app))
+
+                    for scanner in scanners.values():
+                        scanner.finish()
 
         except IOError:
             raise TestFailure('Unable to write log file')
 
-        # Copy output files to benchmark directory
+        # Move output files to benchmark directory
         for fname in test.output_files:
             if os.path.isfile(os.path.join(tmpdir, fname)):
-                copy_file_and_path(fname, tmpdir, test.output_dir)
+                move_file_and_path(fname, tmpdir, test.output_dir)
 
     finally:
         rmtree(tmpdir)
 
+    for fname in [test.out_fname, test.err_fname]:
+        if fname in scanners and scanners[fname].match:
+            lineno, fail_string = scanners[fname].match
+            raise TestFailure('Failure string found in %s (line %i): "%s"'
+                              % (fname, lineno, fail_string))
+
     if exitcode == -11:
         raise TestFailure('Segmentation fault')
     elif exitcode != 0:
         raise TestFailure('Non-zero exit code')
 
-    if dur is None:
+    if perf['duration'] is None:
         raise TestFailure('Program timed out')
 
+    perf['input_staging'] = staged
+    return perf
+
+
+def _execute_repeated(test, app, env, staging, repeat=1, warmup=0):
+    """Executes a test several times, after some warmup runs whose performance
+    is discarded. The output files of every run must be identical. Each run
+    overwrites the results of the previous run, and the performance data of
+    the last run is supplemented by statistics across all runs. The hashes of
+    the output files are stored in test.output_hashes.
+
+    Returns: duration [s]
+    """
+    logger = test.logger
+
+    runs = []
+    hashes = None
+    for i in range(warmup + repeat):
+        if warmup + repeat > 1:
+            suffix = ' (warmup)' if i < warmup else ''
+            logger.debug('Run %i of %i%s' % (i + 1, warmup + repeat, suffix))
+
+        # a declared output that a run fails to produce must not be
+        # mistaken for the file produced by the previous run
+        for fname in test.output_files:
+            p = os.path.join(test.output_dir, fname)
+            if os.path.isfile(p):
+                os.remove(p)
+
+        perf = _execute(test, app, env, staging)
+        if i >= warmup:
+            runs.append(perf)
+
+        h = _output_hashes(test)
+        if hashes is not None and h != hashes:
+            fname = sorted(k for k in h if h[k] != hashes[k])[0]
+            raise TestFailure('Output file differs between runs: "%s"'
+                              % fname)
+        hashes = h
+
+    if repeat > 1:
+        stats = {k: describe([r[k] for r in runs])
+                 for k in ['duration', 'max_memory_MB']}
+        perf['repeat'] = repeat
+        perf['warmup'] = warmup
+        perf['runs'] = stats
+        perf['duration'] = stats['duration']['median']
+        perf['max_memory_MB'] = stats['max_memory_MB']['median']
+
     p_perf = os.path.join(test.output_dir, test.perf_fname)
     with open(p_perf, 'w') as f:
         json.dump(perf, f, sort_keys=True, indent=4, separators=(',', ': '))
 
-    return dur
+    # recorded in the manifest, so identical files are not compared
+    test.output_hashes = hashes
+    return perf['duration']
 
 
-def _postcheck(test):
-    # TODO: support regex?
-    # TODO: highlight which failure string was found
-    if test.fail_strings and len(test.fail_strings) > 0:
-        for fname in [test.out_fname, test.err_fname]:
-            p = os.path.join(test.output_dir, fname)
-            with open(p) as f:
-                for line in f:
-                    if any(s in line for s in test.fail_strings):
-                        raise TestFailure('Failure string found in log')
+def _sampling(app):
+    """Returns the arguments of process.monitor that are specified by the
+    application, which otherwise take their default values.
+    """
+    fields = [('sample_interval', 'dt'), ('max_samples', 'max_ndata')]
+    return {arg: app[k] for k, arg in fields if app[k] is not None}
 
+
+def _output_hashes(test):
+    hashes = {}
+    for fname in test.output_files:
+        p = os.path.join(test.output_dir, fname)
+        hashes[fname] = hash_file(p) if os.path.isfile(p) else None
+    return hashes
+
+
+def _fail_pattern(fail_strings):
+    """Compiles the failure strings into a single regular expression, so that
+    each line of a log is only searched once.
+    """
+    alternatives = [re.escape(s.encode('utf-8')) for s in fail_strings]
+    return re.compile(b'|'.join(alternatives))
+
+
+def _postcheck(test):
     for fname in test.output_files:
         p = os.path.join(test.output_dir, fname)
         if not os.path.isfile(p):
@@ -132,13 +492,20 @@ def _skip_test(test, app):
     return skip
 
 
-def validate_testsuite(ts):
+def validate_testsuite(ts, resume=False):
     p = ts.app.setup_script
     if p and not os.path.exists(p):
         logging.error('Unable to find setup script: "%s"' % p)
         return False
 
-    env = source(ts.app.setup_script) if ts.app.setup_script else os.environ
+    for field, kind in [('sample_interval', (int, float)),
+                        ('max_samples', int)]:
+        n = ts.app[field]
+        if n is not None and (not isinstance(n, kind) or n <= 0):
+            logging.error('Invalid "%s" property: %s' % (field, n))
+            return False
+
+    env = _environment(ts.app)
     if not which(ts.app.exe, env):
         logging.error('Unable to find executable: "%s"' % ts.app.exe)
         return False
@@ -150,17 +517,17 @@ def validate_testsuite(ts):
             return False
 
     p = ts.benchmark_path
-    if os.path.exists(p):
+    if not os.path.exists(p):
+        os.makedirs(p)
+    elif not resume:
         logging.error('Benchmark directory already exists: "%s"' % p)
         return False
-    else:
-        os.makedirs(p)
 
     return True
 
 
 def validate_test(test):
-    logger = logging.getLogger(test.name)
+    logger = test.logger
 
     # not specified by user, but should be set by now
     additional_required_fields = [
@@ -172,6 +539,17 @@ def validate_test(test):
             logger.error('Unable to find "%s" property' % field)
             return False
 
+    if test.input_staging and test.input_staging not in STAGING_METHODS:
+        logger.error('Unrecognised input staging method: "%s"'
+                     % test.input_staging)
+        return False
+
+    for field, minimum in [('repeat', 1), ('warmup', 0)]:
+        n = test[field]
+        if n is not None and (not isinstance(n, int) or n < minimum):
+            logger.error('Invalid "%s" property: %s' % (field, n))
+            return False
+
     if len(test.input_files) > 0:
         p = test.input_dir
         if not os.path.isdir(p):
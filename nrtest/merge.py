@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# system imports
+import os
+import logging
+
+# project imports
+from .testsuite import TestSuite
+from .utility import link_tree
+
+
+def merge_testsuites(suites, benchmark_path):
+    """Merges benchmarks of separate shards of a testsuite into a single
+    benchmark. The results of each test are hardlinked into the new benchmark
+    directory, or else copied.
+
+    Args:
+        suites: list of benchmark testsuites (see TestSuite.read_benchmark)
+        benchmark_path: path to the new benchmark directory
+
+    Returns: merged testsuite, or None if the benchmarks are incompatible
+    """
+    if not validate_testsuites(suites):
+        return None
+
+    if os.path.exists(benchmark_path):
+        logging.error('Benchmark directory already exists: "%s"'
+                      % benchmark_path)
+        return None
+
+    tests = [t for ts in suites for t in ts.tests]
+    sources = {t.name: t.output_dir for t in tests}
+    merged = TestSuite(suites[0].app, tests, benchmark_path)
+
+    os.makedirs(benchmark_path)
+    for t in merged.tests:
+        if os.path.isdir(sources[t.name]):
+            link_tree(sources[t.name], t.output_dir)
+
+    merged.write_manifest()
+    return merged
+
+
+def validate_testsuites(suites):
+    """Validates that benchmarks can be merged: they must have been executed
+    with the same application and contain different tests.
+    """
+    if not suites:
+        logging.error('No benchmarks to merge')
+        return False
+
+    app = suites[0].app.skim()
+    names = set()
+    for ts in suites:
+        if ts.app.skim() != app:
+            logging.error('Benchmark has a different application: "%s"'
+                          % ts.benchmark_path)
+            return False
+
+        for t in ts.tests:
+            if t.name in names:
+                logging.error('Test found in several benchmarks: "%s"'
+                              % t.name)
+                return False
+            names.add(t.name)
+
+    return True
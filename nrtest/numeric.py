@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+
+# Bundled comparisons of numerical result files. These require NumPy, which is
+# an optional dependency, so it is only imported when a comparison is made.
+
+# system imports
+import io
+import os
+from itertools import islice
+
+
+def numeric_compare(path_test, path_ref, rtol, atol, spec=None,
+                    chunk_lines=65536):
+    """Compares text files containing numbers separated by whitespace or
+    commas. Numbers are compatible if |test - ref| <= atol + rtol * |ref|, and
+    NaNs are equal to each other. Other tokens (e.g. column headers) must be
+    identical, and every line must contain the same number of tokens.
+
+    The files are read in chunks of lines, which are parsed into arrays and
+    compared at once, so that memory usage is bounded for large files. Lines
+    that are identical in both files are not parsed.
+
+    This comparison takes no specification in the file type (see
+    compare.split_file_type).
+
+    Returns: dict of statistics of the differences (see DiffStats), where
+        locations are line numbers, or False if the files have a different
+        structure
+    """
+    _no_spec('numeric', spec)
+
+    stats = DiffStats(rtol, atol)
+    same_text = True
+    for chunk in _compare_text(path_test, path_ref, chunk_lines):
+        if chunk is None:
+            return False
+
+        a, b, lineno, same = chunk
+        stats.add(a, b, lineno)
+        same_text = same_text and same
+
+    result = stats.result()
+    result['passed'] = result['passed'] and same_text
+    return result
+
+
+def npy_compare(path_test, path_ref, rtol, atol, spec=None,
+                block_size=65536):
+    """Compares NumPy .npy files, whose arrays must have the same shape.
+    Elements are compatible under the same conditions as numeric_compare().
+
+    The files are memory-mapped and compared in blocks of elements that fit
+    in the CPU cache, so that large arrays are neither read into memory at
+    once nor copied for casting. The type and shape of the arrays are read
+    from the files, so this comparison takes no specification in the file
+    type.
+
+    Returns: dict of statistics of the differences (see DiffStats), where
+        locations are array indices, or False if the shapes differ
+    """
+    import numpy as np
+
+    _no_spec('npy', spec)
+
+    a = np.load(path_test, mmap_mode='r', allow_pickle=False)
+    b = np.load(path_ref, mmap_mode='r', allow_pickle=False)
+    if a.shape != b.shape:
+        return False
+
+    result = _compare_arrays(a, b, rtol, atol, block_size)
+    for k in ['max_abs_error_at', 'max_rel_error_at']:
+        if result[k] is not None:
+            result[k] = [int(i) for i in np.unravel_index(result[k], a.shape)]
+
+    return result
+
+
+def raw_compare(path_test, path_ref, rtol, atol, dtype='<f8',
+                block_size=65536):
+    """Compares binary files of packed numbers, as written by e.g.
+    numpy.ndarray.tofile() or fwrite(). The type of the numbers is given by
+    the file type in the test configuration, e.g. "raw:<f4" for
+    little-endian single precision, and defaults to little-endian double
+    precision. Elements are compared as in npy_compare().
+
+    Returns: dict of statistics of the differences (see DiffStats), where
+        locations are indices of elements, or False if the sizes differ
+    """
+    import numpy as np
+
+    dtype = np.dtype(dtype)
+    size = os.path.getsize(path_test)
+    if size != os.path.getsize(path_ref):
+        return False
+    elif size % dtype.itemsize != 0:
+        msg = 'File size is not a multiple of %i bytes: "%s"'
+        raise ValueError(msg % (dtype.itemsize, path_test))
+    elif size == 0:
+        return DiffStats(rtol, atol).result()
+
+    a = np.memmap(path_test, dtype=dtype, mode='r')
+    b = np.memmap(path_ref, dtype=dtype, mode='r')
+    return _compare_arrays(a, b, rtol, atol, block_size)
+
+
+def _no_spec(ftype, spec):
+    if spec is not None:
+        raise ValueError('The "%s" file type takes no specification: "%s:%s"'
+                         % (ftype, ftype, spec))
+
+
+def _compare_arrays(a, b, rtol, atol, block_size):
+    """Compares arrays of the same shape in blocks of elements, which are cast
+    to a common floating-point type in a buffer as they are read. Elements
+    are visited in C order, so locations are indices into the flattened
+    arrays.
+    """
+    import numpy as np
+
+    dtype = np.result_type(a.dtype, b.dtype, np.float64)
+    it = np.nditer([a, b], flags=['external_loop', 'buffered', 'zerosize_ok'],
+                   op_dtypes=[dtype, dtype], casting='safe', order='C',
+                   buffersize=block_size)
+    stats = DiffStats(rtol, atol)
+    offset = 0
+    for x, y in it:
+        stats.add(x, y, offset=offset)
+        offset += len(x)
+
+    return stats.result()
+
+
+def _compare_text(path_test, path_ref, chunk_lines):
+    """Generates the differences between two text files, in chunks of lines.
+    None is generated if the files have a different structure (i.e. numbers
+    of lines or tokens per line, or positions of non-numeric tokens).
+
+    Yields: tuple of (numbers in test file, numbers in reference file, line
+        number of each number, boolean equality of the non-numeric tokens)
+    """
+    import numpy as np
+
+    offset = 0
+    with io.open(path_test) as f_test, io.open(path_ref) as f_ref:
+        while True:
+            lines_test = list(islice(f_test, chunk_lines))
+            lines_ref = list(islice(f_ref, chunk_lines))
+            if len(lines_test) != len(lines_ref):
+                yield None
+                return
+            elif not lines_test:
+                return
+
+            diff = [i for i, (x, y) in enumerate(zip(lines_test, lines_ref))
+                    if x != y]
+            lineno = np.array(diff, dtype=int) + offset + 1
+            offset += len(lines_test)
+            if not diff:
+                continue
+
+            tokens_test, counts_test = _tokenize(lines_test[i] for i in diff)
+            tokens_ref, counts_ref = _tokenize(lines_ref[i] for i in diff)
+            if counts_test != counts_ref:
+                yield None
+                return
+
+            a, numeric = _parse(tokens_test)
+            b, numeric_ref = _parse(tokens_ref)
+            if not np.array_equal(numeric, numeric_ref):
+                yield None
+                return
+
+            same_text = True
+            if not numeric.all():
+                text = ~numeric
+                same_text = np.array_equal(np.asarray(tokens_test)[text],
+                                           np.asarray(tokens_ref)[text])
+            lineno = np.repeat(lineno, counts_test)[numeric]
+
+            yield a[numeric], b[numeric], lineno, same_text
+
+
+def _tokenize(lines):
+    """Splits lines into tokens at whitespace and commas.
+
+    Returns: tuple of (list of all tokens, list of number of tokens per line)
+    """
+    rows = [line.replace(',', ' ').split() for line in lines]
+    return [t for row in rows for t in row], [len(row) for row in rows]
+
+
+def _parse(tokens):
+    """Converts tokens to numbers. All tokens are converted at once if
+    possible, otherwise each token is converted individually.
+
+    Returns: tuple of (array of numbers, mask of numeric tokens)
+    """
+    import numpy as np
+
+    try:
+        values = np.array(list(map(float, tokens)), dtype=float)
+        return values, np.ones(len(tokens), dtype=bool)
+    except ValueError:
+        pass
+
+    values = np.zeros(len(tokens))
+    numeric = np.zeros(len(tokens), dtype=bool)
+    for i, t in enumerate(tokens):
+        try:
+            values[i] = float(t)
+            numeric[i] = True
+        except ValueError:
+            pass
+
+    return values, numeric
+
+
+class DiffStats(object):
+    """Accumulates statistics of the differences between numbers and their
+    reference values, which are added in blocks. Numbers are compatible if
+    |test - ref| <= atol + rtol * |ref|, and equal infinities and NaNs are
+    compatible with each other. The statistics are:
+
+        passed: whether all numbers are compatible
+        failed: number of incompatible numbers
+        max_abs_error: maximum of |test - ref| over finite numbers
+        max_rel_error: maximum of |test - ref| / |ref| over finite numbers
+            and nonzero references
+        max_abs_error_at, max_rel_error_at: locations of these maxima
+        histogram: upper edges of bins of the errors relative to the
+            tolerance (i.e. |test - ref| / (atol + rtol * |ref|)), and the
+            count in each bin, plus a final count of the larger errors
+
+    Errors are zero for compatible NaNs and infinities, and infinite for
+    other non-finite numbers, which are therefore incompatible even if the
+    tolerance is infinite (i.e. rtol > 0 and the reference is infinite).
+    All the statistics are finite, so that they can be written to a JSON
+    file.
+    """
+    # upper edges of the bins of the histogram
+    bins = [1e-3, 1e-2, 1e-1, 1.0, 1e1, 1e2, 1e3]
+
+    def __init__(self, rtol, atol):
+        self.rtol = rtol
+        self.atol = atol
+        self.failed = 0
+        self.max_abs = (0.0, None)
+        self.max_rel = (0.0, None)
+        self.counts = [0] * (len(self.bins) + 1)
+        self.work = None
+
+    def add(self, a, b, locations=None, offset=0):
+        """Adds a block of numbers.
+
+        Args:
+            a: array of numbers
+            b: array of reference numbers
+            locations: array of the location of each number, which defaults
+                to its index in the block plus offset
+        """
+        import numpy as np
+
+        if len(a) == 0:
+            return
+
+        # the errors are computed in work arrays that are reused for each
+        # block, since allocating new arrays is slower than the arithmetic
+        n = len(a)
+        if self.work is None or self.work.shape[1] < n:
+            self.work = np.empty((3, n))
+        err, ref, tol = self.work[:, :n]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if np.iscomplexobj(a) or np.iscomplexobj(b):
+                np.abs(a - b, out=err)
+            else:
+                np.abs(np.subtract(a, b, out=err), out=err)
+            np.abs(b, out=ref)
+            np.multiply(ref, self.rtol, out=tol)
+            tol += self.atol
+            other = None
+            if not np.isfinite(err).all():
+                # equal infinities and pairs of NaNs are compatible, but any
+                # other non-finite number is not, whatever the tolerance
+                same = (a == b) | (np.isnan(a) & np.isnan(b))
+                err[same] = 0.0
+                other = ~same & ~(np.isfinite(a) & np.isfinite(b))
+                err[other] = np.inf
+                tol[other] = 0.0
+            self.failed += int(np.count_nonzero(err > tol))
+
+            # 0 / 0 is a relative error of zero
+            ratio = np.divide(err, tol, out=tol)
+            nan = np.isnan(ratio)
+            if nan.any():
+                ratio[nan] = 0.0
+
+            # incompatible non-finite numbers and zero references are left
+            # out of the maxima, so that these are finite
+            if other is not None:
+                err[other] = 0.0
+            rel = np.divide(err, ref, out=ref)
+            undefined = ~np.isfinite(rel)
+            if undefined.any():
+                rel[undefined] = 0.0
+
+        # the bins are few, so counting the errors below each upper edge is
+        # much faster than a binary search for the bin of each error
+        below = [np.count_nonzero(ratio <= e) for e in self.bins]
+        below = [0] + below + [len(ratio)]
+        self.counts = [c + int(hi - lo) for c, lo, hi
+                       in zip(self.counts, below[:-1], below[1:])]
+
+        for attr, e in [('max_abs', err), ('max_rel', rel)]:
+            i = int(np.argmax(e))
+            if e[i] > getattr(self, attr)[0]:
+                loc = locations[i] if locations is not None else offset + i
+                setattr(self, attr, (float(e[i]), int(loc)))
+
+    def result(self):
+        """Returns: dict of the statistics"""
+        return {
+            'passed': self.failed == 0,
+            'failed': self.failed,
+            'max_abs_error': self.max_abs[0],
+            'max_abs_error_at': self.max_abs[1],
+            'max_rel_error': self.max_rel[0],
+            'max_rel_error_at': self.max_rel[1],
+            'histogram': {
+                'bins': list(self.bins),
+                'counts': self.counts,
+            },
+        }
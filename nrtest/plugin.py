@@ -2,12 +2,65 @@
 
 # system imports
 import logging
-from pkg_resources import iter_entry_points
+import threading
 
+# Entry points of each group and the function found for each (action,
+# filetype), which are resolved once per process. Worker processes that are
+# forked after prime() inherit them.
+_entry_points = {}
+_functions = {}
+_lock = threading.Lock()
 
-def find_unique_function(action, filetype):
+
+def registry(action):
+    """Returns the entry points registered for an action.
+
+    Returns: dict mapping each filetype to a list of entry points
+    """
     group = 'nrtest.' + action
-    entry_points = list(iter_entry_points(group, filetype))
+    with _lock:
+        if group not in _entry_points:
+            eps = {}
+            for ep in _iter_entry_points(group):
+                same = [e for e in eps.get(ep.name, [])
+                        if describe(e)[0] == describe(ep)[0]]
+                if not same:
+                    eps.setdefault(ep.name, []).append(ep)
+            _entry_points[group] = eps
+
+    return _entry_points[group]
+
+
+def _iter_entry_points(group):
+    """Returns the entry points of a group. These are found using
+    importlib.metadata, which is much faster to import than pkg_resources
+    because it does not scan every installed distribution up front.
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            from pkg_resources import iter_entry_points
+            return list(iter_entry_points(group))
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=group))
+    return list(eps.get(group, []))
+
+
+def find_unique_function(action, filetype):
+    key = (action, filetype)
+    if key not in _functions:
+        _functions[key] = _find_unique_function(action, filetype)
+
+    return _functions[key]
+
+
+def _find_unique_function(action, filetype):
+    entry_points = registry(action).get(filetype, [])
 
     if len(entry_points) == 0:
         msg = ('Cannot locate a {0} function for the "{1}" filetype. '
@@ -19,9 +72,43 @@ def find_unique_function(action, filetype):
     elif len(entry_points) > 1:
         msg = ('Discovered multiple {0} functions for the "{1}" filetype. '
                'They were discovered in the packages: {2}'
-               ).format(action, filetype, [ep.dist for ep in entry_points])
+               ).format(action, filetype, [describe(ep)[1]
+                                           for ep in entry_points])
         logging.error(msg)
         return None
 
     else:
         return entry_points[0].load()
+
+
+def prime(action='compare'):
+    """Loads the functions of every filetype registered for an action, so that
+    later lookups are cheap.
+
+    Returns: dict mapping each filetype to its function (or None if it is
+        registered by several packages)
+    """
+    return {ft: find_unique_function(action, ft) for ft in registry(action)}
+
+
+def register(action, filetype, function):
+    """Registers a function for a filetype in this process, overriding any
+    entry points. This is useful when nrtest is used as a library.
+    """
+    _functions[(action, filetype)] = function
+
+
+def describe(ep):
+    """Returns a description of an entry point: the object it refers to and the
+    package that registered it.
+    """
+    if hasattr(ep, 'value'):
+        target = ep.value
+    else:
+        target = '%s:%s' % (ep.module_name, '.'.join(ep.attrs))
+
+    dist = getattr(ep, 'dist', None)
+    if dist is not None and hasattr(dist, 'metadata'):
+        dist = '%s %s' % (dist.metadata['Name'], dist.version)
+
+    return target, str(dist)
@@ -3,14 +3,22 @@
 # system imports
 import os
 import sys
+import json
+import hashlib
+import logging
+import threading
+import math
+import time
+import select
 import subprocess
-from datetime import datetime
 
 # third-party imports
 import six
 import psutil
-# using psutil.Process.wait() in unconventional manner
-from psutil import TimeoutExpired as ProcessNotFinished
+
+# project imports
+from .stats import Series, Summary
+from .utility import cache_dir, write_json_atomic
 
 
 def source(script, old_env=None):
@@ -27,6 +35,77 @@ def source(script, old_env=None):
     return dict((line.split('=', 1) for line in stdout.splitlines() if len(line.split('=', 1)) == 2))
 
 
+_source_cache = {}
+_source_lock = threading.Lock()
+
+
+def cached_source(script, old_env=None):
+    """Memoized version of source(). The resulting environment is cached in
+    memory and on disk, so that it is only computed once per test suite and
+    then reused across invocations.
+
+    The cache is keyed by the path, modification time and contents of the
+    script, and by the parent environment. If any of these change, the script
+    is sourced again. Changes to other files used by the script (e.g. other
+    scripts that it sources) are not detected, in which case the on-disk
+    cache should be disabled (see utility.cache_dir).
+    """
+    if not os.path.isfile(script):
+        return None
+
+    key = _source_key(script, old_env)
+
+    # hold the lock whilst sourcing, so concurrent tests only source once
+    with _source_lock:
+        if key not in _source_cache:
+            _source_cache[key] = _read_source_cache(key)
+        if _source_cache[key] is None:
+            env = source(script, old_env)
+            _write_source_cache(key, env)
+            _source_cache[key] = env
+
+    return dict(_source_cache[key])
+
+
+def _source_key(script, old_env):
+    script = os.path.abspath(script)
+    if old_env is None:
+        old_env = os.environ
+
+    h = hashlib.sha1()
+    h.update(script.encode('utf-8'))
+    h.update(repr(os.path.getmtime(script)).encode('utf-8'))
+    with open(script, 'rb') as f:
+        h.update(f.read())
+    h.update(json.dumps(sorted(old_env.items())).encode('utf-8'))
+
+    return h.hexdigest()
+
+
+def _read_source_cache(key):
+    d = cache_dir('env')
+    if d is None:
+        return None
+
+    try:
+        with open(os.path.join(d, key + '.json')) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_source_cache(key, env):
+    d = cache_dir('env')
+    if d is None:
+        return
+
+    try:
+        # the environment may contain secrets, e.g. tokens of a CI job
+        write_json_atomic(os.path.join(d, key + '.json'), env, mode=0o600)
+    except (IOError, OSError) as e:
+        logging.debug('Unable to cache environment: %s' % e)
+
+
 def execute(cmd, stdin=None, stdout=None, stderr=subprocess.STDOUT,
             cwd=None, env=None):
     """Execute command as child process.
@@ -46,106 +125,542 @@ def execute(cmd, stdin=None, stdout=None, stderr=subprocess.STDOUT,
         cmd = shlex.split(cmd)
 
     # Don't pass kwargs because I want to limit functionality
-    return psutil.Popen(cmd, stdin=stdin, stdout=stdout, stderr=stderr,
+    start_time = time.time()
+    proc = psutil.Popen(cmd, stdin=stdin, stdout=stdout, stderr=stderr,
                         cwd=cwd, env=env)
 
+    # more precise than create_time(), which has a resolution of one second
+    proc.start_time = start_time
+    return proc
+
+
+def kill(proc):
+    """Kill a process and all of its descendants, if they are still running.
+    Otherwise, processes launched by a wrapper script (e.g. mpirun) would
+    continue running after the wrapper has been killed.
+    """
+    procs = [proc]
+    try:
+        procs.extend(proc.children(recursive=True))
+    except psutil.Error:
+        pass
+
+    for p in procs:
+        try:
+            p.kill()
+        except psutil.Error:
+            pass
+
 
-def monitor(proc, timeout=None, min_dt=1, max_ndata=10):
-    """Monitor the status of a process and record performance data. If the
-    number of measurements exceeds max_ndata, the data is resampled and the
-    time between measurements is increased.
+class OutputScanner(threading.Thread):
+    """Thread that copies an output stream of a process to a file, whilst
+    searching each line for a regular expression. The first time it is found,
+    the process is killed so that it does not continue needlessly.
+
+    Attributes:
+        match: (line number, matched string) of the first match, or None
+    """
+    def __init__(self, proc, stream, f_out, pattern):
+        """
+        Args:
+            proc: instance of psutil.Popen class.
+            stream: binary output stream of the process.
+            f_out: binary file object to which the stream is copied.
+            pattern: compiled regular expression (of bytes).
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.proc = proc
+        self.stream = stream
+        self.f_out = f_out
+        self.pattern = pattern
+        self.match = None
+        self.detached = False
+        self.lock = threading.Lock()
+
+    def run(self):
+        lines = iter(self.stream.readline, b'')
+        for lineno, line in enumerate(lines, 1):
+            with self.lock:
+                if self.detached:
+                    break
+                self.f_out.write(line)
+            if self.match is None:
+                m = self.pattern.search(line)
+                if m:
+                    s = m.group(0).decode('utf-8', 'replace')
+                    self.match = (lineno, s)
+                    kill(self.proc)
+
+        self.stream.close()
+
+    def finish(self, timeout=1.0):
+        """Waits for the rest of the output of the process, which has exited,
+        to be copied. The stream stays open as long as any background process
+        launched by the process holds it, so after the timeout the file is
+        abandoned instead, as if the output had been redirected to the file.
+        Nothing is written to the file after this returns.
+        """
+        self.join(timeout)
+        with self.lock:
+            self.detached = True
+
+
+def monitor(proc, timeout=None, dt=0.1, max_ndata=1000):
+    """Monitor the status of a process and record performance data.
+
+    Measurements are made every dt seconds. They are summarised by streaming
+    statistics (minimum, maximum, mean and quantiles) of the whole execution,
+    and stored as a time series of at most max_ndata measurements (see
+    stats.Series). The memory used is therefore bounded, however long the
+    process runs. The peak memory usage is also measured by the kernel, so
+    that it is known even for processes that finish before the first
+    measurement.
+
+    The process is monitored by a single sampler thread that is shared by all
+    processes, so this function only waits for it to finish.
+
+    Measurements include all descendants of the process (e.g. processes
+    launched by a wrapper script or by mpirun). Memory usage, CPU usage and
+    I/O are summed over these processes, and the peak of each process is also
+    reported individually.
 
     Args:
         proc:      instance of psutil.Popen class.
         timeout:   time after which process will be killed [seconds].
-        min_dt:    minimum time between performance measurements [seconds].
-        max_ndata: maximum number of performace measurements.
+        dt:        time between performance measurements [seconds].
+        max_ndata: maximum number of performance measurements stored.
 
     Returns:
         (exit_code, performance): where performance is a dictionary containing
             data relating to the process performance (duration, maximum memory
-            usage, and performance measurements made throughout execution).
+            usage, totals of CPU time and I/O, summary statistics and a time
+            series of measurements, and the peaks of each process).
             Duration is set to None if the process times out.
     """
-    resampling_factor = 2
-
-    time_init = datetime.fromtimestamp(proc.create_time())
-    dt = min_dt
-    ndata = 0
-    data = {}
-    max_memory = 0.0
-
-    # This block uses the psutil.Process.wait() method in an unconventional
-    # manner, in order to precisely determine the process duration, whilst
-    # also choosing the sampling rate of performance measurements. Please only
-    # edit if you fully understand how this works, as it is easy to break.
-    while True:
-        try:
-            exit_code = proc.wait(dt)
+    watch = sampler().watch(proc, timeout, dt, max_ndata)
+    watch.finished.wait()
 
-            # Process has finished
-            duration = (datetime.now() - time_init).total_seconds()
-            break
+    return (watch.exit_code, watch.performance())
 
-        # Process has not finished
-        except ProcessNotFinished:
 
-            t = (datetime.now() - time_init).total_seconds()
+_sampler = None
+_sampler_lock = threading.Lock()
 
-            # Measure performance
+
+def sampler():
+    """Returns the Sampler shared by all processes, starting it if necessary.
+    """
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None or _sampler.owner != os.getpid():
+            _sampler = Sampler()
+        return _sampler
+
+
+class _Watch(object):
+    """State of a process monitored by the Sampler."""
+
+    def __init__(self, proc, timeout, dt, max_ndata):
+        self.proc = proc
+        self.pid = proc.pid
+        self.pidfd = _pidfd_open(proc.pid)
+        self.time_init = getattr(proc, 'start_time', None) or \
+            proc.create_time()
+        self.timeout = timeout
+        self.timed_out = False
+        self.dt = dt
+        self.next_sample = time.time() + dt
+        self.series = Series(max_ndata)
+        self.summaries = {'cpu_pcnt': Summary(), 'memory_MB': Summary()}
+        self.max_memory = 0.0
+        self.processes = {}
+        self.previous = None
+        self.exit_code = None
+        self.duration = None
+        self.finished = threading.Event()
+
+    def add_sample(self, datum):
+        self.series.add(datum)
+        for k, summary in self.summaries.items():
+            summary.add(datum[k])
+        self.max_memory = max(self.max_memory, datum['memory_MB'])
+
+    def finish(self, exit_code, now, rusage):
+        if self.timed_out:
+            self.exit_code = 0
+            self.duration = None
+        else:
+            self.exit_code = exit_code
+            self.duration = now - self.time_init
+
+        # the kernel measures the peak memory and total CPU time of the
+        # process (including descendants that it waited for) precisely
+        self.cpu_time = self.previous[1]['cpu_time'] if self.previous else 0.
+        if rusage is not None:
+            max_rss = float(rusage.ru_maxrss) * _maxrss_unit / 1024 / 1024
+            self.max_memory = max(self.max_memory, max_rss)
+            self.cpu_time = max(self.cpu_time,
+                                rusage.ru_utime + rusage.ru_stime)
+
+        self.finished.set()
+
+    def performance(self):
+        """Returns the performance data of the finished process."""
+        perf = {
+            'duration': self.duration,
+            'max_memory_MB': self.max_memory,
+            'cpu_time': self.cpu_time,
+            'sample_interval': self.dt * self.series.stride,
+            'samples': self.series.to_dict(),
+            'summary': {k: v.to_dict() for k, v in self.summaries.items()},
+            'processes': self.summarise_processes(),
+        }
+
+        if self.previous and 'read_bytes' in self.previous[1]:
+            totals = self.previous[1]
+            perf['read_MB'] = float(totals['read_bytes']) / 1024 / 1024
+            perf['write_MB'] = float(totals['write_bytes']) / 1024 / 1024
+
+        return perf
+
+    def update_processes(self, counters):
+        """Updates the peaks of each process, and returns the totals summed
+        over processes. CPU time and I/O of processes that have finished
+        continue to contribute to the totals.
+        """
+        for pid, c in counters.items():
+            if pid not in self.processes:
+                self.processes[pid] = {'name': c['name'], 'rss': 0}
+            p = self.processes[pid]
+            p.update(c, rss=max(p['rss'], c['rss']))
+
+        totals = {
+            'cpu_time': sum(p['cpu_time'] for p in self.processes.values()),
+            'rss': sum(c['rss'] for c in counters.values()),
+        }
+        if any('read_bytes' in p for p in self.processes.values()):
+            for k in ['read_bytes', 'write_bytes']:
+                totals[k] = sum(p.get(k, 0) for p in self.processes.values())
+
+        return totals
+
+    def summarise_processes(self, max_processes=100):
+        """Returns the peaks of each process, limited to the processes with the
+        largest memory usage.
+        """
+        procs = sorted(self.processes.items(), key=lambda x: -x[1]['rss'])
+        summary = []
+        for pid, p in sorted(procs[:max_processes]):
+            d = {
+                'pid': pid,
+                'name': p['name'],
+                'cpu_time': p['cpu_time'],
+                'max_memory_MB': float(p['rss']) / 1024 / 1024,
+            }
+            if 'read_bytes' in p:
+                d['read_MB'] = float(p['read_bytes']) / 1024 / 1024
+                d['write_MB'] = float(p['write_bytes']) / 1024 / 1024
+            summary.append(d)
+
+        return summary
+
+    def next_event(self):
+        """Time at which the process next needs attention."""
+        t = self.next_sample
+        if self.timeout and not self.timed_out:
+            t = min(t, self.time_init + self.timeout)
+        return t
+
+
+class Sampler(object):
+    """Monitors many processes from a single thread, which records their
+    performance and detects when they finish or exceed their timeout.
+
+    Where supported (Linux), the performance of all processes is read from
+    /proc, and the end of each process is detected through a pidfd, so that
+    its duration is measured precisely. Otherwise, psutil is used and the
+    processes are polled every poll_interval seconds.
+    """
+    poll_interval = 0.02
+
+    def __init__(self):
+        self.owner = os.getpid()
+        self.watches = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.use_poll = hasattr(select, 'poll')
+        if self.use_poll:
+            self.pipe_r, self.pipe_w = os.pipe()
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def watch(self, proc, timeout=None, dt=0.1, max_ndata=1000):
+        """Starts monitoring a process.
+
+        Returns: _Watch object, whose finished event is set when the process
+            has finished
+        """
+        watch = _Watch(proc, timeout, dt, max_ndata)
+        with self.lock:
+            self.watches[watch.pid] = watch
+
+        if self.use_poll:
+            os.write(self.pipe_w, b'x')
+        else:
+            self.wakeup.set()
+
+        return watch
+
+    def _run(self):
+        while True:
+            try:
+                self._step()
+            except Exception:
+                logging.exception('Error whilst monitoring processes')
+                time.sleep(self.poll_interval)
+
+    def _step(self):
+        with self.lock:
+            watches = list(self.watches.values())
+
+        # sleep until a process needs attention or a pidfd is readable
+        timeout = None
+        if watches:
+            t = min(w.next_event() for w in watches)
+            timeout = max(0, t - time.time())
+            if any(w.pidfd is None for w in watches):
+                timeout = min(timeout, self.poll_interval)
+        ready = self._wait(watches, timeout)
+
+        now = time.time()
+        for w in watches:
+            if w.pidfd is None or w.pid in ready:
+                result = _poll(w.proc)
+                if result is not None:
+                    self._finish(w, now, *result)
+                    continue
+
+            timeout = w.timeout and now - w.time_init >= w.timeout
+            if timeout and not w.timed_out:
+                kill(w.proc)
+                w.timed_out = True
+
+            if now >= w.next_sample:
+                self._sample(w, now)
+
+    def _wait(self, watches, timeout):
+        """Returns the set of pids whose pidfd has become readable."""
+        if not self.use_poll:
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+            return set()
+
+        poller = select.poll()
+        poller.register(self.pipe_r, select.POLLIN)
+        fds = {}
+        for w in watches:
+            if w.pidfd is not None:
+                poller.register(w.pidfd, select.POLLIN)
+                fds[w.pidfd] = w.pid
+
+        ready = set()
+        ms = None if timeout is None else int(math.ceil(timeout * 1000))
+        for fd, _ in poller.poll(ms):
+            if fd == self.pipe_r:
+                os.read(self.pipe_r, 4096)
+            else:
+                ready.add(fds[fd])
+
+        return ready
+
+    def _sample(self, w, now):
+        t = now - w.time_init
+        counters = {}
+        for pid in [w.pid] + _descendants(w.pid):
             try:
-                datum = _measure_performance(proc, t)
-                for k in datum.keys():
-                    if k not in data:
-                        data[k] = []
-                    data[k].append(datum[k])
-                ndata += 1
-                max_memory = max(max_memory, datum['memory_MB'])
-            except (psutil.AccessDenied, psutil.NoSuchProcess):
+                counters[pid] = _read_counters(pid)
+            except (psutil.Error, IOError, OSError, ValueError):
                 continue
 
-            # Kill process if it exceeds timeout period
-            if timeout and t >= timeout:
-                proc.kill()
-                exit_code = 0
-                duration = None
-                break
+        if w.pid not in counters:
+            w.next_sample = now + w.dt
+            return
+
+        totals = w.update_processes(counters)
+        w.add_sample(_measure_performance(totals, t, w.previous))
+        w.previous = (t, totals)
+        w.next_sample = now + w.dt
+
+    def _finish(self, w, now, exit_code, rusage):
+        with self.lock:
+            del self.watches[w.pid]
+        if w.pidfd is not None:
+            os.close(w.pidfd)
 
-            # Resample data if necessary
-            if ndata >= max_ndata:
-                for arr in data.values():
-                    del arr[::resampling_factor]
-                ndata = len(data)
-                dt *= resampling_factor
+        w.finish(exit_code, now, rusage)
 
-    data['duration'] = duration
-    data['max_memory_MB'] = max_memory
 
-    return (exit_code, data)
+def _pidfd_open(pid):
+    """Returns a file descriptor that becomes readable when the process
+    finishes, or None if this is not supported.
+    """
+    try:
+        return os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return None
+
+
+def _poll(proc):
+    """Reaps a process if it has finished.
+
+    Returns: (exit code, resource usage) if the process has finished, else
+        None. Resource usage is None where not supported.
+    """
+    if not hasattr(os, 'wait4'):
+        exit_code = proc.poll()
+        return None if exit_code is None else (exit_code, None)
+
+    try:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+    except OSError:
+        # already reaped
+        return (proc.wait(), None)
+
+    if pid == 0:
+        return None
+
+    # let subprocess interpret the exit status and record the exit code
+    proc._handle_exitstatus(status)
+    return (proc.returncode, rusage)
 
 
-def _measure_performance(proc, time):
+# units of ru_maxrss [bytes]
+_maxrss_unit = 1 if sys.platform.startswith('darwin') else 1024
+
+
+_use_procfs = sys.platform.startswith('linux') and os.path.isdir('/proc/self')
+
+_use_children_file = _use_procfs and \
+    os.path.exists('/proc/self/task/%i/children' % os.getpid())
+
+if _use_procfs:
+    _page_size = os.sysconf('SC_PAGE_SIZE')
+    _clock_ticks = float(os.sysconf('SC_CLK_TCK'))
+
+
+def _read_counters(pid):
+    if _use_procfs:
+        return _read_procfs(pid)
+    else:
+        return _read_psutil(pid)
+
+
+def _descendants(pid):
+    """Returns the pids of all descendants of a process.
+    """
+    if not _use_children_file:
+        try:
+            children = psutil.Process(pid).children(recursive=True)
+            return [p.pid for p in children]
+        except psutil.Error:
+            return []
+
+    # children are listed separately for each thread of a process
+    descendants, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            for tid in os.listdir('/proc/%i/task' % p):
+                with open('/proc/%i/task/%s/children' % (p, tid), 'rb') as f:
+                    children = [int(c) for c in f.read().split()]
+                descendants.extend(children)
+                stack.extend(children)
+        except (IOError, OSError):
+            continue
+
+    return descendants
+
+
+def _measure_performance(counters, time, previous=None):
     """Measure performance statistics of process.
 
     Args:
-        proc: instance of psutil.Popen class.
+        counters: cumulative counters read from the process.
         time: time at which measurement is made (is appended to data).
+        previous: (time, counters) of the previous measurement, if any.
 
     Returns:
         dict containing performance data at this time.
     """
+    t0, cpu_time0 = 0.0, 0.0
+    if previous:
+        t0, cpu_time0 = previous[0], previous[1]['cpu_time']
+
+    dt = time - t0
+    cpu_time = counters['cpu_time'] - cpu_time0
+
     datum = {
         'time': time,
-        'cpu_pcnt': proc.cpu_percent(),
-        'memory_MB': float(proc.memory_info().rss) / 1024 / 1024,
+        'cpu_pcnt': 100. * cpu_time / dt if dt > 0 else 0.0,
+        'memory_MB': float(counters['rss']) / 1024 / 1024,
     }
 
-    if not sys.platform.startswith('darwin') and \
-       not sys.platform.lower().startswith('sunos'):
-
-        read_MB = float(proc.io_counters().read_bytes) / 1024 / 1024
-        write_MB = float(proc.io_counters().write_bytes) / 1024 / 1024
-        datum['read_MB'] = read_MB
-        datum['write_MB'] = write_MB
+    if 'read_bytes' in counters:
+        datum['read_MB'] = float(counters['read_bytes']) / 1024 / 1024
+        datum['write_MB'] = float(counters['write_bytes']) / 1024 / 1024
 
     return datum
+
+
+def _read_procfs(pid):
+    """Reads the cumulative CPU time [seconds], resident memory [bytes] and
+    I/O [bytes] of a process from /proc.
+    """
+    with open('/proc/%i/stat' % pid, 'rb') as f:
+        stat = f.read()
+    # the executable name may contain spaces and parentheses
+    name = stat[stat.index(b'(') + 1:stat.rindex(b')')]
+    fields = stat[stat.rindex(b')') + 2:].split()
+    utime, stime = int(fields[11]), int(fields[12])
+
+    with open('/proc/%i/statm' % pid, 'rb') as f:
+        resident = int(f.read().split()[1])
+
+    counters = {
+        'name': name.decode('utf-8', 'replace'),
+        'cpu_time': (utime + stime) / _clock_ticks,
+        'rss': resident * _page_size,
+    }
+
+    try:
+        with open('/proc/%i/io' % pid, 'rb') as f:
+            for line in f:
+                k, v = line.split(b':')
+                if k in (b'read_bytes', b'write_bytes'):
+                    counters[k.decode()] = int(v)
+    except (IOError, OSError):
+        pass
+
+    return counters
+
+
+def _read_psutil(pid):
+    """Reads the same counters as _read_procfs() using psutil.
+    """
+    proc = psutil.Process(pid)
+    cpu = proc.cpu_times()
+    counters = {
+        'name': proc.name(),
+        'cpu_time': cpu.user + cpu.system,
+        'rss': proc.memory_info().rss,
+    }
+
+    if hasattr(proc, 'io_counters'):
+        io = proc.io_counters()
+        counters['read_bytes'] = io.read_bytes
+        counters['write_bytes'] = io.write_bytes
+
+    return counters
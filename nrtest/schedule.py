@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+# system imports
+import os.path
+import sys
+import json
+import logging
+import threading
+
+# third-party imports
+import six
+from six.moves import queue
+
+# project imports
+from . import Test
+from .utility import slugify
+
+
+def read_history(benchmark_path, tests):
+    """Reads the performance data recorded for each test in a previous
+    benchmark. Tests that are not found in the benchmark are omitted.
+
+    Args:
+        benchmark_path: path to a previous benchmark directory
+        tests: list of Test objects
+
+    Returns: dict mapping test name to performance data
+    """
+    if not os.path.isdir(benchmark_path):
+        logging.warning('History benchmark not found: "%s"' % benchmark_path)
+        return {}
+
+    history = {}
+    for t in tests:
+        p = os.path.join(benchmark_path, slugify(t.name), Test.perf_fname)
+        try:
+            with open(p) as f:
+                history[t.name] = json.load(f)
+        except (IOError, OSError, ValueError):
+            continue
+
+    return history
+
+
+def expected_duration(test, history):
+    """Returns the duration of a test in a previous benchmark [seconds], or
+    None if it is unknown.
+    """
+    perf = history.get(test.name)
+    return perf.get('duration') if perf else None
+
+
+def expected_memory(test, history):
+    """Returns the peak memory usage expected of a test [MB]. This is declared
+    in the test configuration or else taken from a previous benchmark. If it
+    is unknown, zero is returned.
+    """
+    if test.get('memory_MB') is not None:
+        return float(test.memory_MB)
+
+    perf = history.get(test.name)
+    if perf and perf.get('max_memory_MB') is not None:
+        return float(perf['max_memory_MB'])
+
+    return 0.0
+
+
+def order_tests(tests, history):
+    """Orders tests by decreasing expected duration, i.e. longest processing
+    time (LPT) first. When tests run concurrently, this avoids a long test
+    being started last and setting the total duration on its own.
+
+    Tests without a known duration are placed first, in their original order,
+    because they might be long too.
+
+    Args:
+        tests: list of Test objects
+        history: dict mapping test name to performance data
+
+    Returns: list of Test objects
+    """
+    unknown = [t for t in tests if expected_duration(t, history) is None]
+    known = [t for t in tests if expected_duration(t, history) is not None]
+    known.sort(key=lambda t: expected_duration(t, history), reverse=True)
+
+    return unknown + known
+
+
+def shard_tests(tests, history, index, count):
+    """Splits tests into shards with roughly equal expected durations, and
+    returns one of these shards. Each test is assigned, in order of decreasing
+    duration, to the shard with the least total duration so far. Tests with
+    unknown duration are assumed to take the median duration of the others.
+
+    The split only depends on the test names and history, so that separate
+    machines compute the same shards.
+
+    Args:
+        tests: list of Test objects
+        history: dict mapping test name to performance data
+        index: shard to return (0 <= index < count)
+        count: number of shards
+
+    Returns: list of Test objects, in their original order
+    """
+    known = [expected_duration(t, history) for t in tests]
+    known = sorted(d for d in known if d is not None)
+    default = known[len(known) // 2] if known else 1.0
+
+    def duration(test):
+        d = expected_duration(test, history)
+        return default if d is None else d
+
+    loads = [0.0] * count
+    assigned = set()
+    for test in sorted(tests, key=lambda t: (-duration(t), t.name)):
+        i = loads.index(min(loads))
+        loads[i] += duration(test)
+        if i == index:
+            assigned.add(test.name)
+
+    return [t for t in tests if t.name in assigned]
+
+
+def run_concurrently(func, tests, jobs, memory_limit=None, memory=None):
+    """Calls func(test) for each test in a separate thread, with at most jobs
+    threads running at once.
+
+    If memory_limit is given, a test is only started if its expected memory
+    usage fits within the memory left over by the tests already running. The
+    tests are considered in order, but a test that does not fit is passed
+    over in favour of the first later test that does, so that small tests are
+    packed around large ones. A test that exceeds memory_limit on its own is
+    started once no other test is running.
+
+    Args:
+        func: function called with each test
+        tests: list of Test objects, in order of priority
+        jobs: maximum number of tests running at once
+        memory_limit: memory available to the tests [MB]
+        memory: dict mapping test name to expected memory usage [MB]
+
+    Returns: list of the values returned by func, in order of completion
+    """
+    memory = memory or {}
+    pending = list(tests)
+    running = {}
+    finished = queue.Queue()
+    results = []
+
+    def worker(test):
+        try:
+            finished.put((test, func(test), None))
+        except BaseException:
+            finished.put((test, None, sys.exc_info()))
+
+    def admissible(test):
+        if not running or memory_limit is None:
+            return True
+        in_use = sum(running.values())
+        return in_use + memory.get(test.name, 0.0) <= memory_limit
+
+    while pending or running:
+        for test in list(pending):
+            if len(running) >= jobs:
+                break
+            if not admissible(test):
+                continue
+
+            pending.remove(test)
+            running[test.name] = memory.get(test.name, 0.0)
+            thread = threading.Thread(target=worker, args=(test,))
+            thread.daemon = True
+            thread.start()
+
+        test, result, exc_info = finished.get()
+        del running[test.name]
+        if exc_info:
+            six.reraise(*exc_info)
+        results.append(result)
+
+    return results
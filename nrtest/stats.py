@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# system imports
+import math
+from array import array
+
+
+def percentile(values, q):
+    """Returns the q-th quantile (0 <= q <= 1) of a sequence of values, using
+    linear interpolation between the closest ranks.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+
+    pos = q * (len(values) - 1)
+    lo = int(math.floor(pos))
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (pos - lo) * (values[hi] - values[lo])
+
+
+def describe(values):
+    """Returns robust statistics of a small sample of values: the median,
+    interquartile range and minimum.
+    """
+    return {
+        'median': percentile(values, 0.5),
+        'iqr': percentile(values, 0.75) - percentile(values, 0.25),
+        'min': min(values),
+    }
+
+
+class Quantile(object):
+    """Streaming estimate of a quantile, using the P-square algorithm of Jain
+    and Chlamtac (1985). Only five markers are stored, regardless of the
+    number of observations.
+    """
+    def __init__(self, q):
+        self.q = q
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * q, 4 * q, 2 + 2 * q, 4]
+        self.increments = [0, q / 2., q, (1 + q) / 2., 1]
+
+    def add(self, x):
+        h, n = self.heights, self.positions
+
+        # the first five observations initialise the markers
+        if len(h) < 5:
+            h.append(x)
+            h.sort()
+            return
+
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = max(i for i in range(4) if h[i] <= x)
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # adjust the heights of the middle markers if necessary
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or \
+               (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not h[i - 1] < height < h[i + 1]:
+                    height = self._linear(i, d)
+                h[i] = height
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        h, n = self.heights, self.positions
+        return h[i] + float(d) / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+
+    def _linear(self, i, d):
+        h, n = self.heights, self.positions
+        return h[i] + float(d) * (h[i + d] - h[i]) / (n[i + d] - n[i])
+
+    def value(self):
+        if len(self.heights) < 5 or self.positions[4] < 5:
+            return percentile(self.heights, self.q)
+        return self.heights[2]
+
+
+class Summary(object):
+    """Streaming summary statistics of a sequence of values: count, minimum,
+    maximum, mean and several quantiles. Memory usage is constant.
+    """
+    quantiles = [0.5, 0.9, 0.99]
+
+    def __init__(self):
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.mean = None
+        self.estimators = [Quantile(q) for q in self.quantiles]
+
+    def add(self, x):
+        self.n += 1
+        if self.n == 1:
+            self.min = self.max = self.mean = x
+        else:
+            self.min = min(self.min, x)
+            self.max = max(self.max, x)
+            self.mean += (x - self.mean) / self.n
+
+        for e in self.estimators:
+            e.add(x)
+
+    def to_dict(self):
+        d = {'n': self.n, 'min': self.min, 'max': self.max, 'mean': self.mean}
+        for e in self.estimators:
+            d['p%g' % (100 * e.q)] = e.value()
+        return d
+
+
+class Series(object):
+    """Time series of samples with a fixed capacity, stored in arrays of
+    doubles. When the capacity is reached, every other stored sample is
+    discarded and subsequently only every other sample is stored. The series
+    therefore always spans the whole period, with a resolution that decreases
+    as the period grows.
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.stride = 1
+        self.count = 0
+        self.columns = None
+
+    def add(self, datum):
+        """Adds a sample, which is a dict of values. Every sample must contain
+        the same keys.
+        """
+        if self.columns is None:
+            self.columns = {k: array('d') for k in datum}
+
+        self.count += 1
+        if (self.count - 1) % self.stride:
+            return
+
+        for k, col in self.columns.items():
+            col.append(datum[k])
+
+        if len(col) >= self.capacity:
+            for col in self.columns.values():
+                del col[1::2]
+            self.stride *= 2
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def to_dict(self):
+        return {k: col.tolist() for k, col in (self.columns or {}).items()}
@@ -1,19 +1,27 @@
 # -*- coding: utf-8 -*-
 
 # system imports
+import re
 import json
-import os.path
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from fnmatch import fnmatchcase
 
 # project imports
 from . import Application, Test
-from .utility import slugify
+from .utility import slugify, open_atomic, cache_dir, write_json_atomic
 
 
 class TestSuite(object):
     """The TestSuite class stores metadata about the application under test
     and the tests themselves. It also provides the interface to benchmarks.
     """
-    manifest_fname = 'manifest.json'
+    manifest_fname = 'manifest.jsonl'
+    legacy_manifest_fname = 'manifest.json'
+    journal_fname = 'manifest.journal'
 
     def __init__(self, app, tests, benchmark_path):
         """Constructs an instance of the TestSuite class.
@@ -26,6 +34,7 @@ class TestSuite(object):
         self.app = app
         self.tests = sorted(tests)
         self.benchmark_path = benchmark_path
+        self._journal_lock = threading.Lock()
 
         for t in self.tests:
             t.output_dir = os.path.join(benchmark_path, slugify(t.name))
@@ -44,43 +53,305 @@ class TestSuite(object):
             app = Application.for_execution(json.load(f))
 
         tests = []
-        for p in test_config_paths:
-            with open(p) as f:
-                t = Test.for_execution(json.load(f))
-                t.input_dir = os.path.dirname(p)
-                tests.append(t)
+        for p, data in zip(test_config_paths, read_configs(test_config_paths)):
+            t = Test.for_execution(data)
+            t.input_dir = os.path.dirname(p)
+            tests.append(t)
 
         return cls(app, tests, benchmark_path)
 
     @classmethod
-    def read_benchmark(cls, benchmark_path):
+    def read_benchmark(cls, benchmark_path, pattern=None):
         """Constructs a TestSuite instance from a benchmark directory,
         which is suitable for compare commands.
 
-        This reads metadata from a JSON manifest, and constructs the
+        This reads metadata from the manifest, and constructs the
         Application instance and each of the Test instances.
+
+        Args:
+            benchmark_path: path to benchmark directory
+            pattern: if given, only tests whose name matches this glob
+                pattern are read
         """
-        manifest_path = os.path.join(benchmark_path, cls.manifest_fname)
-        with open(manifest_path) as f:
-            manifest = json.load(f)
+        app, records = cls.read_manifest(benchmark_path, pattern)
 
-        app = Application.for_comparison(manifest['Application'])
-        tests = [Test.for_comparison(test) for test in manifest['Tests']]
+        app = Application.for_comparison(app)
+        tests = [Test.for_comparison(record) for record in records]
 
         return cls(app, tests, benchmark_path)
 
+    @classmethod
+    def find_manifest(cls, benchmark_path):
+        """Returns the path to the manifest of a benchmark, or None if it is
+        not found. Benchmarks created by older versions have a manifest
+        containing a single JSON document.
+        """
+        for fname in [cls.manifest_fname, cls.legacy_manifest_fname]:
+            p = os.path.join(benchmark_path, fname)
+            if os.path.exists(p):
+                return p
+        return None
+
+    @classmethod
+    def read_manifest(cls, benchmark_path, pattern=None):
+        """Reads the manifest of a benchmark. The metadata of the tests is read
+        lazily, one line at a time, so that a large manifest is never held in
+        memory. If a pattern is given, only the name of each test is parsed
+        before it is filtered.
+
+        Args:
+            benchmark_path: path to benchmark directory
+            pattern: glob pattern matched against test names
+
+        Returns: tuple of application metadata (dict) and a generator of test
+            metadata (dicts)
+        """
+        p = cls.find_manifest(benchmark_path)
+        if p is None:
+            raise IOError('Benchmark manifest not found: "%s"'
+                          % benchmark_path)
+
+        if os.path.basename(p) == cls.legacy_manifest_fname:
+            with open(p) as f:
+                manifest = json.load(f)
+            records = (t for t in manifest['Tests']
+                       if pattern is None or fnmatchcase(t['name'], pattern))
+            return manifest['Application'], records
+
+        f = open(p)
+        try:
+            app = json.loads(f.readline())['Application']
+        except BaseException:
+            f.close()
+            raise
+
+        return app, _read_records(f, pattern)
+
     def write_manifest(self):
-        """Writes a JSON manifest containing application and test metadata
-        needed for compare commands.
+        """Writes a manifest containing application and test metadata needed
+        for compare commands. The first line contains the application, and
+        each following line contains a test, in JSON format.
 
         Output format must remain compatible with the read_benchmark() method.
         """
-        manifest = {
-            'Application': self.app.skim(),
-            'Tests': [test.skim() for test in self.tests]
-        }
-
         path = os.path.join(self.benchmark_path, self.manifest_fname)
-        with open(path, 'w') as f:
-            json.dump(manifest, f, sort_keys=True, indent=4,
-                      separators=(',', ': '))
+        with open_atomic(path) as f:
+            f.write(json.dumps({'Application': self.app.skim()},
+                               sort_keys=True) + '\n')
+            for test in self.tests:
+                f.write(_dump_record(test.skim()))
+
+    def append_journal(self, test):
+        """Appends the metadata of a finished test to the journal, which is a
+        file containing one JSON object per line. The journal is flushed to
+        disk, so that the test is not lost if execution is interrupted. A
+        partially written last line, left by an interruption, is terminated
+        first so that the new line is not joined onto it.
+        """
+        path = os.path.join(self.benchmark_path, self.journal_fname)
+        line = _dump_record(test.skim()).encode('utf-8')
+
+        with self._journal_lock:
+            with open(path, 'a+b') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = b'\n' + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read_journal(self):
+        """Reads the metadata of the tests recorded in the journal. A partially
+        written last line, left by an interruption, is ignored.
+
+        Returns: dict mapping test name to metadata
+        """
+        path = os.path.join(self.benchmark_path, self.journal_fname)
+        if not os.path.exists(path):
+            return {}
+
+        records = {}
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record['name']] = record
+
+        return records
+
+
+def find_configs(paths, recursive=False):
+    """Finds test config files. Each path is either a config file or a
+    directory containing config files (i.e. JSON files).
+
+    Args:
+        paths: list of paths to config files or directories
+        recursive: if True, subdirectories are also searched
+
+    Returns: sorted list of paths to config files, without duplicates
+    """
+    configs = set()
+    for p in paths:
+        if os.path.isfile(p):
+            configs.add(os.path.normpath(p))
+            continue
+
+        dirs = [p]
+        while dirs:
+            subdirs, fnames = _scan_dir(dirs.pop())
+            configs.update(f for f in fnames if f.endswith('.json'))
+            if recursive:
+                dirs.extend(subdirs)
+
+    return sorted(configs)
+
+
+def _scan_dir(d):
+    """Returns lists of the paths to subdirectories and to files within a
+    directory. Where possible, this avoids a stat() call for each entry.
+    Symbolic links to directories are not included, like os.walk(), so that
+    they cannot lead to a directory twice or in a loop.
+    """
+    subdirs, fnames = [], []
+    if hasattr(os, 'scandir'):
+        for entry in os.scandir(d):
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(os.path.normpath(entry.path))
+            elif entry.is_file():
+                fnames.append(os.path.normpath(entry.path))
+    else:
+        for fname in os.listdir(d):
+            p = os.path.normpath(os.path.join(d, fname))
+            if os.path.isdir(p) and not os.path.islink(p):
+                subdirs.append(p)
+            elif os.path.isfile(p):
+                fnames.append(p)
+
+    return subdirs, fnames
+
+
+def read_configs(paths, threads=16):
+    """Reads JSON config files. Files are read concurrently, because this is
+    dominated by I/O latency on network filesystems. The contents of each
+    file are cached in an index on disk, keyed by its path, modification time
+    and size, so that unchanged files are not read again by later invocations
+    (see utility.cache_dir).
+
+    Args:
+        paths: list of paths to JSON files
+        threads: maximum number of files read concurrently
+
+    Returns: list of the contents of each file
+    """
+    keys = [_file_key(p) for p in paths]
+    index_path = _index_path(paths)
+    index = _read_index(index_path)
+
+    missing = [p for p, k in zip(paths, keys) if index.get(k[0], [])[:3] != k]
+    if missing:
+        def read(p):
+            with open(p) as f:
+                return json.load(f)
+
+        if len(missing) > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(threads, len(missing)))
+            try:
+                contents = pool.map(read, missing)
+            finally:
+                pool.close()
+        else:
+            contents = [read(p) for p in missing]
+
+        data = dict(zip(missing, contents))
+    else:
+        data = {}
+
+    new_index = {}
+    results = []
+    for p, k in zip(paths, keys):
+        if p in data:
+            new_index[k[0]] = k + [data[p]]
+        else:
+            new_index[k[0]] = index[k[0]]
+        results.append(new_index[k[0]][3])
+
+    if missing and index_path:
+        try:
+            write_json_atomic(index_path, new_index)
+        except (IOError, OSError) as e:
+            logging.debug('Unable to cache config index: %s' % e)
+
+    return results
+
+
+def _file_key(p):
+    st = os.stat(p)
+    mtime = getattr(st, 'st_mtime_ns', st.st_mtime)
+    return [os.path.abspath(p), mtime, st.st_size]
+
+
+def _index_path(paths):
+    """Returns the path to the index of a set of config files, which is keyed
+    by the directories that contain them.
+    """
+    d = cache_dir('configs')
+    if d is None:
+        return None
+
+    dirs = sorted(set(os.path.dirname(os.path.abspath(p)) for p in paths))
+    key = hashlib.sha1(json.dumps(dirs).encode('utf-8')).hexdigest()
+    return os.path.join(d, key + '.json')
+
+
+def _read_index(path):
+    """Reads an index of config files, which maps the absolute path of each
+    file to a list of [path, mtime, size, contents].
+    """
+    if path is None:
+        return {}
+
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+# Matches the name at the start of a line of the manifest, so that tests can
+# be filtered without parsing the whole line
+_name_re = re.compile(r'\{"name": ("(?:[^"\\]|\\.)*")')
+
+
+def _dump_record(record):
+    """Serialises the metadata of a test as a single line of JSON, with the
+    name first.
+    """
+    items = [('name', record['name'])]
+    items.extend(sorted((k, v) for k, v in record.items() if k != 'name'))
+    return json.dumps(OrderedDict(items)) + '\n'
+
+
+def _read_records(f, pattern=None):
+    """Generates the metadata of each test in a manifest file, whose first line
+    has already been read. The file is closed once exhausted.
+    """
+    with f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            if pattern is not None:
+                m = _name_re.match(line)
+                if m:
+                    name = json.loads(m.group(1))
+                else:
+                    name = json.loads(line)['name']
+                if not fnmatchcase(name, pattern):
+                    continue
+
+            yield json.loads(line)
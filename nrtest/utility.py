@@ -4,8 +4,12 @@
 import os
 import sys
 import re
+import json
+import hashlib
 import shutil
 import time
+import uuid
+from contextlib import contextmanager
 
 
 def color(string, c):
@@ -33,11 +37,228 @@ def copy_file_and_path(rel_path, src_dir, dest):
 
     E.g. copy subdir/foo.txt from dir1/ to dir2/ results in dir2/subdir/foo.txt
     """
-    folders, _ = os.path.split(rel_path)
+    folders, fname = os.path.split(rel_path)
     dest = os.path.join(dest, folders)
     if not os.path.isdir(dest):
         os.makedirs(dest)
-    shutil.copy(os.path.join(src_dir, rel_path), dest)
+    copy_file(os.path.join(src_dir, rel_path), os.path.join(dest, fname))
+
+
+def move_file_and_path(rel_path, src_dir, dest):
+    """Move a relative filepath from src_dir to dest, whilst generating any
+    directories included in rel_path (see copy_file_and_path).
+
+    The file is renamed if possible, which avoids reading and writing its
+    data. Otherwise (e.g. the directories are on different filesystems), it
+    is copied and then removed.
+    """
+    src = os.path.join(src_dir, rel_path)
+    dst = os.path.join(dest, rel_path)
+
+    folders = os.path.dirname(dst)
+    if not os.path.isdir(folders):
+        os.makedirs(folders)
+
+    try:
+        replace = getattr(os, 'replace', os.rename)
+        replace(src, dst)
+    except OSError:
+        copy_file(src, dst)
+        os.remove(src)
+
+
+def copy_file(src, dst):
+    """Copy the data and permission bits of a file.
+
+    Where possible, the data is copied by the kernel (copy_file_range or
+    sendfile) instead of passing through user space. With copy_file_range,
+    the filesystem may also share data blocks or copy data on the server.
+    """
+    with open(src, 'rb') as f_src:
+        with open(dst, 'wb') as f_dst:
+            _copy_fileobj(f_src, f_dst)
+    shutil.copymode(src, dst)
+
+
+def _copy_file_range(fd_src, fd_dst, offset, count):
+    return os.copy_file_range(fd_src, fd_dst, count, offset, offset)
+
+
+def _sendfile(fd_src, fd_dst, offset, count):
+    os.lseek(fd_dst, offset, os.SEEK_SET)
+    return os.sendfile(fd_dst, fd_src, offset, count)
+
+
+def _copy_fileobj(f_src, f_dst, blocksize=2 ** 23):
+    fd_src, fd_dst = f_src.fileno(), f_dst.fileno()
+    offset = 0
+
+    # each method continues from where the previous one failed
+    for name, func in [('copy_file_range', _copy_file_range),
+                       ('sendfile', _sendfile)]:
+        if not hasattr(os, name):
+            continue
+        try:
+            while True:
+                n = func(fd_src, fd_dst, offset, blocksize)
+                if n == 0:
+                    return
+                offset += n
+        except OSError:
+            continue
+
+    f_src.seek(offset)
+    f_dst.seek(offset)
+    shutil.copyfileobj(f_src, f_dst, blocksize)
+
+
+STAGING_METHODS = ['copy', 'reflink', 'hardlink', 'symlink']
+
+# ioctl request to share the data blocks of a file (Linux)
+FICLONE = 0x40049409
+
+
+def stage_file(rel_path, src_dir, dest, method='copy'):
+    """Make a relative filepath from src_dir available in dest, whilst
+    generating any directories included in rel_path (see copy_file_and_path).
+
+    The file is either copied, or else linked to avoid copying its data:
+        reflink:  copy-on-write clone, supported by some filesystems
+        hardlink: additional directory entry for the same file
+        symlink:  symbolic link to the original file
+    If linking fails (e.g. the directories are on different filesystems, or
+    the filesystem does not support it), the file is copied instead.
+
+    Note that with the hardlink and symlink methods, any modification of the
+    staged file also modifies the original file.
+
+    Returns: the method used
+    """
+    src = os.path.join(src_dir, rel_path)
+    dst = os.path.join(dest, rel_path)
+
+    folders = os.path.dirname(dst)
+    if not os.path.isdir(folders):
+        os.makedirs(folders)
+
+    try:
+        if method == 'reflink':
+            _reflink(src, dst)
+            return method
+        elif method == 'hardlink':
+            os.link(src, dst)
+            return method
+        elif method == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+            return method
+    except (IOError, OSError, AttributeError, ImportError):
+        pass
+
+    copy_file(src, dst)
+    return 'copy'
+
+
+def _reflink(src, dst):
+    import fcntl
+
+    try:
+        with open(src, 'rb') as f_src:
+            with open(dst, 'wb') as f_dst:
+                fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+    except (IOError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+
+    shutil.copymode(src, dst)
+
+
+def link_tree(src_dir, dest):
+    """Hardlink every file within src_dir into dest, whilst generating any
+    subdirectories. Files are copied if they cannot be linked.
+    """
+    for root, _, fnames in os.walk(src_dir):
+        for fname in fnames:
+            rel_path = os.path.relpath(os.path.join(root, fname), src_dir)
+            stage_file(rel_path, src_dir, dest, 'hardlink')
+
+
+def hash_file(path, blocksize=2 ** 20):
+    """Returns a hash of the contents of a file, as a string of the form
+    "algorithm:hexdigest". The fastest available algorithm is used, so hashes
+    are only equal if computed with the same algorithm.
+    """
+    h = hashlib.blake2b() if hasattr(hashlib, 'blake2b') else hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+
+    return '%s:%s' % (h.name, h.hexdigest())
+
+
+def cache_dir(name):
+    """Returns the path to a directory for caching data between invocations,
+    creating it if necessary. The cache is stored in ~/.cache/nrtest unless
+    the NRTEST_CACHE_DIR environment variable is set. If this variable is set
+    to an empty string, caching is disabled and None is returned.
+    """
+    root = os.environ.get('NRTEST_CACHE_DIR')
+    if root is None:
+        xdg = os.environ.get('XDG_CACHE_HOME')
+        xdg = xdg or os.path.expanduser('~/.cache')
+        root = os.path.join(xdg, 'nrtest')
+    elif not root:
+        return None
+
+    # the cache may contain sensitive data (e.g. sourced environments), so
+    # it is only accessible by the user
+    path = os.path.join(root, name)
+    for d in [root, path]:
+        try:
+            os.makedirs(d, 0o700)
+        except OSError:
+            if not os.path.isdir(d):
+                return None
+
+    return path
+
+
+@contextmanager
+def open_atomic(path, mode=None):
+    """Opens a file for writing, such that a concurrent reader never sees a
+    partially written file and a crash never leaves one behind. The data is
+    written to a temporary file, which replaces the file on exit.
+
+    Args:
+        path: path to the file
+        mode: permissions of the file (e.g. 0o600), which are otherwise
+            determined by the umask
+    """
+    tmp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+    try:
+        if mode is None:
+            f = open(tmp_path, 'w')
+        else:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+            f = os.fdopen(os.open(tmp_path, flags, mode), 'w')
+        with f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        replace = getattr(os, 'replace', os.rename)
+        replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json_atomic(path, data, mode=None, **kwargs):
+    """Write data to a JSON file atomically (see open_atomic). Other keyword
+    arguments are passed to json.dump().
+    """
+    with open_atomic(path, mode) as f:
+        json.dump(data, f, **kwargs)
 
 
 def rmtree(path):
@@ -18,6 +18,7 @@ requirements = [
     'six',
     'psutil>=2.0',
     'packaging',
+    'importlib_metadata; python_version < "3.8"',
 ]
 
 # bundled actions
@@ -25,9 +26,17 @@ entry_points = {
     'nrtest.compare': [
         'default=nrtest.compare:default_compare',
         'null=nrtest.compare:null_compare',
+        'numeric=nrtest.numeric:numeric_compare',
+        'npy=nrtest.numeric:npy_compare',
+        'raw=nrtest.numeric:raw_compare',
     ]
 }
 
+# optional dependencies of bundled actions
+extras_require = {
+    'numeric': ['numpy'],
+}
+
 setup(
     name='nrtest',
     version='0.2.5',
@@ -45,6 +54,7 @@ setup(
     entry_points=entry_points,
     include_package_data=True,
     install_requires=requirements,
+    extras_require=extras_require,
     license="MIT",
     zip_safe=False,
     keywords='nrtest',
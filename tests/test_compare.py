@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_compare
+----------------------------------
+
+Tests for comparison of a test against a benchmark.
+"""
+
+# system imports
+import os
+import json
+import tempfile
+import unittest
+
+# project imports
+from nrtest import Test
+from nrtest import Application
+from nrtest.compare import compare_test, compare_testsuite, default_compare
+from nrtest.plugin import register
+from nrtest.testsuite import TestSuite
+from nrtest.utility import rmtree
+
+
+def make_test(output_dir, perf):
+    test = Test.for_comparison({
+        'name': 'test',
+        'version': '1.0',
+        'description': None,
+        'output_files': {},
+        'passed': True,
+        'error_msg': None,
+    })
+    test.output_dir = output_dir
+
+    with open(os.path.join(output_dir, test.perf_fname), 'w') as f:
+        json.dump(perf, f)
+
+    return test
+
+
+class TestComparePerformance(unittest.TestCase):
+    def setUp(self):
+        self.new_path = tempfile.mkdtemp()
+        self.old_path = tempfile.mkdtemp()
+        self.old = make_test(self.old_path, {
+            'duration': 10.0,
+            'max_memory_MB': 100.0,
+            'read_MB': 5.0,
+            'write_MB': 5.0,
+        })
+
+    def tearDown(self):
+        rmtree(self.new_path)
+        rmtree(self.old_path)
+
+    def compare(self, perf, **kwargs):
+        new = make_test(self.new_path, perf)
+        return compare_test(new, self.old, 0.01, 0.0, perf_rtol=0.3, **kwargs)
+
+    def test_pass(self):
+        c = self.compare({'duration': 12.0, 'max_memory_MB': 100.0})
+        self.assertTrue(c['passed'])
+        self.assertEqual(sorted(c['performance']), ['duration',
+                                                    'max_memory_MB'])
+
+    def test_regression(self):
+        c = self.compare({'duration': 14.0, 'max_memory_MB': 100.0,
+                          'read_MB': [0.0, 50.0], 'write_MB': [0.0, 5.0]})
+        self.assertFalse(c['passed'])
+        self.assertEqual(c['error_msg'],
+                         'Performance regression: duration +40%, io_MB +450%')
+
+    def test_zero_reference(self):
+        self.old = make_test(self.old_path, {'duration': 10.0,
+                                             'read_MB': 0.0, 'write_MB': 0.0})
+        c = self.compare({'duration': 10.0, 'read_MB': 20.0, 'write_MB': 0.0})
+        self.assertFalse(c['passed'])
+        self.assertIsNone(c['performance']['io_MB']['change'])
+        self.assertEqual(c['error_msg'],
+                         'Performance regression: io_MB +20 (from 0)')
+
+    def test_absolute_tolerance(self):
+        c = self.compare({'duration': 14.0}, perf_atol={'duration': 5.0})
+        self.assertTrue(c['passed'])
+        self.assertFalse(c['performance']['duration']['regressed'])
+
+    def test_disabled(self):
+        new = make_test(self.new_path, {'duration': 100.0})
+        c = compare_test(new, self.old, 0.01, 0.0)
+        self.assertTrue(c['passed'])
+        self.assertNotIn('performance', c)
+
+
+def broken_compare(path_test, path_ref, rtol, atol):
+    raise ValueError('unreadable')
+
+
+def stats_compare(path_test, path_ref, rtol, atol):
+    passed = default_compare(path_test, path_ref, rtol, atol)
+    return {'passed': passed, 'failed': 0 if passed else 1}
+
+
+def make_benchmark(path, outputs):
+    """Creates a benchmark containing a test for each dict of output files and
+    their contents.
+    """
+    app = Application.for_comparison({'name': 'app', 'version': '1.0',
+                                      'description': None})
+    tests = [Test.for_comparison({
+        'name': 'test%i' % i,
+        'version': '1.0',
+        'description': None,
+        'output_files': {fname: ftype for fname, (ftype, _) in out.items()},
+        'passed': True,
+        'error_msg': None,
+    }) for i, out in enumerate(outputs)]
+
+    ts = TestSuite(app, tests, path)
+    for t, out in zip(ts.tests, outputs):
+        os.makedirs(t.output_dir)
+        for fname, (_, content) in out.items():
+            if content is not None:
+                with open(os.path.join(t.output_dir, fname), 'w') as f:
+                    f.write(content)
+
+    return ts
+
+
+class TestCompareParallel(unittest.TestCase):
+    def setUp(self):
+        self.new_path = tempfile.mkdtemp()
+        self.old_path = tempfile.mkdtemp()
+        register('compare', 'default', default_compare)
+        register('compare', 'broken', broken_compare)
+
+    def tearDown(self):
+        rmtree(self.new_path)
+        rmtree(self.old_path)
+
+    def test_identical_to_serial(self):
+        old = [{'a.txt': ('default', 'a'), 'b.txt': ('default', 'b')}] * 4
+        new = [
+            {'a.txt': ('default', 'a'), 'b.txt': ('default', 'b')},
+            {'a.txt': ('default', 'x'), 'b.txt': ('default', 'y')},
+            {'a.txt': ('default', 'a'), 'b.txt': ('broken', 'b')},
+            {'a.txt': ('default', None), 'b.txt': ('default', 'x')},
+        ]
+        ts_old = make_benchmark(self.old_path, old)
+        ts_new = make_benchmark(self.new_path, new)
+
+        receipts = []
+        for jobs in [1, 3]:
+            p = os.path.join(self.new_path, 'receipt%i.json' % jobs)
+            passed = compare_testsuite(ts_new, ts_old, 0.01, 0.0, p,
+                                       jobs=jobs)
+            self.assertFalse(passed)
+            with open(p) as f:
+                receipts.append(json.load(f))
+
+        self.assertEqual(receipts[0], receipts[1])
+        errors = [t['error_msg'] for t in receipts[0]['Tests']]
+        self.assertIsNone(errors[0])
+        self.assertEqual(errors[1], 'a.txt: diff failed')
+        self.assertEqual(errors[2],
+                         'Exception raised during diff: unreadable')
+        self.assertTrue(errors[3].startswith('Output file not found'))
+
+
+class TestOutputHashes(unittest.TestCase):
+    def setUp(self):
+        self.new_path = tempfile.mkdtemp()
+        self.old_path = tempfile.mkdtemp()
+        register('compare', 'broken', broken_compare)
+
+        out = [{'a.txt': ('broken', 'a')}]
+        self.ts_old = make_benchmark(self.old_path, out)
+        self.ts_new = make_benchmark(self.new_path, out)
+
+    def tearDown(self):
+        rmtree(self.new_path)
+        rmtree(self.old_path)
+
+    def compare(self, hash_new, hash_old):
+        self.ts_new.tests[0].output_hashes = {'a.txt': hash_new}
+        self.ts_old.tests[0].output_hashes = {'a.txt': hash_old}
+        return compare_test(self.ts_new.tests[0], self.ts_old.tests[0],
+                            0.01, 0.0)
+
+    def test_identical(self):
+        self.assertTrue(self.compare('sha1:00', 'sha1:00')['passed'])
+
+    def test_different(self):
+        self.assertFalse(self.compare('sha1:00', 'sha1:01')['passed'])
+        self.assertFalse(self.compare(None, None)['passed'])
+
+
+class TestCompareStats(unittest.TestCase):
+    def setUp(self):
+        self.new_path = tempfile.mkdtemp()
+        self.old_path = tempfile.mkdtemp()
+        register('compare', 'default', default_compare)
+        register('compare', 'stats', stats_compare)
+
+        old = [{'a.txt': ('default', 'a'), 'b.txt': ('stats', 'b'),
+                'c.txt': ('default', 'c')}]
+        new = [{'a.txt': ('default', 'x'), 'b.txt': ('stats', 'y'),
+                'c.txt': ('default', 'c')}]
+        self.ts_old = make_benchmark(self.old_path, old)
+        self.ts_new = make_benchmark(self.new_path, new)
+
+    def tearDown(self):
+        rmtree(self.new_path)
+        rmtree(self.old_path)
+
+    def compare(self, **kwargs):
+        return compare_test(self.ts_new.tests[0], self.ts_old.tests[0],
+                            0.01, 0.0, **kwargs)
+
+    def test_first_failure(self):
+        comparison = self.compare()
+        self.assertFalse(comparison['passed'])
+        self.assertEqual(comparison['error_msg'], 'a.txt: diff failed')
+        self.assertNotIn('files', comparison)
+
+    def test_every_file(self):
+        comparison = self.compare(stats=True)
+        self.assertFalse(comparison['passed'])
+        self.assertEqual(comparison['error_msg'],
+                         'a.txt: diff failed; b.txt: diff failed')
+        self.assertEqual(comparison['files'], {
+            'a.txt': {'passed': False, 'error_msg': None},
+            'b.txt': {'passed': False, 'failed': 1, 'error_msg': None},
+            'c.txt': {'passed': True, 'error_msg': None},
+        })
+
+    def test_parallel(self):
+        receipts = []
+        for jobs in [1, 2]:
+            p = os.path.join(self.new_path, 'receipt%i.json' % jobs)
+            compare_testsuite(self.ts_new, self.ts_old, 0.01, 0.0, p,
+                              jobs=jobs, stats=True)
+            with open(p) as f:
+                receipts.append(json.load(f))
+
+        self.assertEqual(receipts[0], receipts[1])
+        self.assertIn('files', receipts[0]['Tests'][0])
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -8,9 +8,11 @@ test_config
 Tests for input validation of tests and apps.
 """
 
+import logging
+import pickle
 import unittest
 
-from nrtest import Application, Test
+from nrtest import Application, Test, get_test_logger
 
 test_execution = {
     'name': 'test',
@@ -87,6 +89,39 @@ class TestConversion(unittest.TestCase):
         Application.for_comparison(app.skim())
 
 
+class TestAccess(unittest.TestCase):
+    def setUp(self):
+        self.test = Test.for_execution(test_execution.copy())
+
+    def test_attributes(self):
+        self.test.output_dir = 'out'
+        self.assertEqual(self.test['output_dir'], 'out')
+        self.assertEqual(self.test.name, self.test['name'])
+        self.assertFalse(hasattr(self.test, 'unknown'))
+        self.assertFalse(hasattr(self.test, '__dict__'))
+
+        del self.test.output_dir
+        self.assertNotIn('output_dir', self.test)
+
+    def test_pickle(self):
+        test = pickle.loads(pickle.dumps(self.test))
+        self.assertIsInstance(test, Test)
+        self.assertEqual(dict(test), dict(self.test))
+
+    def test_logger(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        get_test_logger().addHandler(handler)
+        try:
+            self.test.logger.warning('message')
+        finally:
+            get_test_logger().removeHandler(handler)
+
+        self.assertEqual(records[0].test, 'test')
+        self.assertNotIn('logger', self.test)
+
+
 if __name__ == '__main__':
     import sys
     sys.exit(unittest.main())
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_execute
+----------------------------------
+
+Tests for execution of a TestSuite.
+"""
+
+# system imports
+import os.path
+import json
+import tempfile
+import time
+import unittest
+
+# project imports
+from nrtest import Application, Test
+from nrtest import execute as nrtest_execute
+from nrtest.execute import execute_testsuite, validate_testsuite
+from nrtest.testsuite import TestSuite
+from nrtest.utility import rmtree
+
+app = Application.for_execution({
+    'name': 'app',
+    'version': '1.0',
+    'exe': 'sleep',
+})
+
+
+def make_tests(n, args):
+    return [Test.for_execution({
+        'name': 'sleep%i' % i,
+        'version': '1.0',
+        'args': list(args),
+    }) for i in range(n)]
+
+
+class CacheTestCase(unittest.TestCase):
+    """Points the caches at a temporary directory while tests are executed,
+    so that the cache of the user is never written.
+    """
+    def setUp(self):
+        self.cache_path = tempfile.mkdtemp()
+        os.environ['NRTEST_CACHE_DIR'] = self.cache_path
+        nrtest_execute._hash_cache.clear()
+
+    def tearDown(self):
+        del os.environ['NRTEST_CACHE_DIR']
+        rmtree(self.cache_path)
+        nrtest_execute._hash_cache.clear()
+
+
+class TestParallelExecution(CacheTestCase):
+    def setUp(self):
+        super(TestParallelExecution, self).setUp()
+        self.benchmark_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestParallelExecution, self).tearDown()
+        rmtree(self.benchmark_path)
+
+    def test_concurrent(self):
+        ts = TestSuite(app, make_tests(4, ['1']), self.benchmark_path)
+
+        start = time.time()
+        self.assertTrue(execute_testsuite(ts, jobs=4))
+        self.assertLess(time.time() - start, 3.0)
+
+        for t in ts.tests:
+            self.assertTrue(t.passed)
+            self.assertTrue(os.path.isdir(t.output_dir))
+
+    def test_failure(self):
+        tests = make_tests(3, ['0'])
+        tests[1].args = ['not_a_number']
+        ts = TestSuite(app, tests, self.benchmark_path)
+
+        self.assertFalse(execute_testsuite(ts, jobs=2))
+        self.assertEqual([t.passed for t in ts.tests], [True, False, True])
+
+
+bash = Application.for_execution({
+    'name': 'bash',
+    'version': '1.0',
+    'exe': 'bash',
+})
+
+
+class TestSampling(CacheTestCase):
+    def setUp(self):
+        super(TestSampling, self).setUp()
+        self.benchmark_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestSampling, self).tearDown()
+        rmtree(self.benchmark_path)
+
+    def test_application_fields(self):
+        sampled = Application.for_execution(dict(app, sample_interval=0.01,
+                                                 max_samples=8))
+        ts = TestSuite(sampled, make_tests(1, ['0.5']),
+                       os.path.join(self.benchmark_path, 'new'))
+        self.assertTrue(validate_testsuite(ts))
+        self.assertTrue(execute_testsuite(ts))
+
+        test = ts.tests[0]
+        with open(os.path.join(test.output_dir, test.perf_fname)) as f:
+            perf = json.load(f)
+        self.assertGreater(perf['sample_interval'], 0.01)
+        self.assertLessEqual(len(perf['samples']['time']), 8)
+
+    def test_invalid(self):
+        sampled = Application.for_execution(dict(app, max_samples=0))
+        ts = TestSuite(sampled, make_tests(1, ['0']),
+                       os.path.join(self.benchmark_path, 'new'))
+        self.assertFalse(validate_testsuite(ts))
+
+
+class TestFailStrings(CacheTestCase):
+    def setUp(self):
+        super(TestFailStrings, self).setUp()
+        self.benchmark_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestFailStrings, self).tearDown()
+        rmtree(self.benchmark_path)
+
+    def test_early_kill(self):
+        test = Test.for_execution({
+            'name': 'nan',
+            'version': '1.0',
+            'args': ['-c', '"echo start; echo NaN detected; sleep 10"'],
+            'fail_strings': ['Error', 'NaN'],
+        })
+        ts = TestSuite(bash, [test], self.benchmark_path)
+
+        start = time.time()
+        self.assertFalse(execute_testsuite(ts))
+        self.assertLess(time.time() - start, 5.0)
+        self.assertIn('stdout.log (line 2): "NaN"', test.error_msg)
+
+        with open(os.path.join(test.output_dir, test.out_fname)) as f:
+            self.assertEqual(f.read(), 'start\nNaN detected\n')
+
+    def test_background_process(self):
+        test = Test.for_execution({
+            'name': 'background',
+            'version': '1.0',
+            'args': ['-c', '"sleep 8 & echo hi"'],
+            'fail_strings': ['Error'],
+        })
+        ts = TestSuite(bash, [test], self.benchmark_path)
+
+        start = time.time()
+        self.assertTrue(execute_testsuite(ts))
+        self.assertLess(time.time() - start, 5.0)
+
+        with open(os.path.join(test.output_dir, test.out_fname)) as f:
+            self.assertEqual(f.read(), 'hi\n')
+
+
+class TestRepeat(CacheTestCase):
+    def setUp(self):
+        super(TestRepeat, self).setUp()
+        self.benchmark_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestRepeat, self).tearDown()
+        rmtree(self.benchmark_path)
+
+    def make_test(self, command):
+        return Test.for_execution({
+            'name': 'repeat',
+            'version': '1.0',
+            'args': ['-c', '"%s"' % command],
+            'output_files': {'out.txt': 'default'},
+            'repeat': 3,
+        })
+
+    def test_statistics(self):
+        test = self.make_test('echo 1 > out.txt')
+        ts = TestSuite(bash, [test], self.benchmark_path)
+        self.assertTrue(execute_testsuite(ts, warmup=1))
+
+        with open(os.path.join(test.output_dir, test.perf_fname)) as f:
+            perf = json.load(f)
+        self.assertEqual((perf['repeat'], perf['warmup']), (3, 1))
+        self.assertEqual(perf['duration'], perf['runs']['duration']['median'])
+        self.assertLessEqual(perf['runs']['duration']['min'], perf['duration'])
+        self.assertEqual(list(test.output_hashes), ['out.txt'])
+
+    def test_override(self):
+        test = self.make_test('echo 1 > out.txt')
+        test.warmup = 0
+        ts = TestSuite(bash, [test], self.benchmark_path)
+        self.assertTrue(execute_testsuite(ts, warmup=2))
+
+        with open(os.path.join(test.output_dir, test.perf_fname)) as f:
+            perf = json.load(f)
+        self.assertEqual((perf['repeat'], perf['warmup']), (3, 0))
+
+    def test_different_outputs(self):
+        test = self.make_test('echo $RANDOM$RANDOM > out.txt')
+        ts = TestSuite(bash, [test], self.benchmark_path)
+        self.assertFalse(execute_testsuite(ts))
+        self.assertEqual(test.error_msg,
+                         'Output file differs between runs: "out.txt"')
+
+    def test_invalid(self):
+        test = self.make_test('echo 1 > out.txt')
+        ts = TestSuite(bash, [test], self.benchmark_path)
+        self.assertRaises(ValueError, execute_testsuite, ts, repeat=0)
+        self.assertRaises(ValueError, execute_testsuite, ts, warmup=-1)
+
+    def test_missing_output(self):
+        marker = os.path.join(self.benchmark_path, 'marker')
+        test = self.make_test('test -e %s || echo 1 > out.txt; touch %s'
+                              % (marker, marker))
+        ts = TestSuite(bash, [test], self.benchmark_path)
+        self.assertFalse(execute_testsuite(ts))
+        self.assertEqual(test.error_msg,
+                         'Output file differs between runs: "out.txt"')
+
+
+class TestResume(CacheTestCase):
+    def setUp(self):
+        super(TestResume, self).setUp()
+        self.benchmark_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestResume, self).tearDown()
+        rmtree(self.benchmark_path)
+
+    def test_resume(self):
+        ts = TestSuite(app, make_tests(1, ['0']), self.benchmark_path)
+        self.assertTrue(execute_testsuite(ts))
+        marker = os.path.join(ts.tests[0].output_dir, 'marker')
+        open(marker, 'w').close()
+
+        ts = TestSuite(app, make_tests(2, ['0']), self.benchmark_path)
+        self.assertTrue(execute_testsuite(ts, resume=True))
+        self.assertTrue(os.path.exists(marker))
+        self.assertEqual(sorted(ts.read_journal()), ['sleep0', 'sleep1'])
+
+    def test_restart(self):
+        ts = TestSuite(app, make_tests(1, ['0']), self.benchmark_path)
+        self.assertTrue(execute_testsuite(ts))
+        marker = os.path.join(ts.tests[0].output_dir, 'marker')
+        open(marker, 'w').close()
+
+        tests = make_tests(1, ['0'])
+        tests[0].version = '2.0'
+        ts = TestSuite(app, tests, self.benchmark_path)
+        self.assertTrue(execute_testsuite(ts, resume=True))
+        self.assertFalse(os.path.exists(marker))
+
+    def test_changed_args(self):
+        ts = TestSuite(app, make_tests(1, ['x']), self.benchmark_path)
+        self.assertFalse(execute_testsuite(ts))
+
+        ts = TestSuite(app, make_tests(1, ['0']), self.benchmark_path)
+        self.assertTrue(execute_testsuite(ts, resume=True))
+        self.assertIsNone(ts.tests[0].error_msg)
+
+
+class TestReuse(CacheTestCase):
+    def setUp(self):
+        super(TestReuse, self).setUp()
+        self.old_path = tempfile.mkdtemp()
+        self.new_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestReuse, self).tearDown()
+        rmtree(self.old_path)
+        rmtree(self.new_path)
+
+    def test_reuse(self):
+        ts_old = TestSuite(app, make_tests(2, ['0']), self.old_path)
+        self.assertTrue(execute_testsuite(ts_old))
+        ts_old.write_manifest()
+        ts_old = TestSuite.read_benchmark(self.old_path)
+
+        tests = make_tests(2, ['0'])
+        tests[1].args = ['0.1']
+        ts_new = TestSuite(app, tests, self.new_path)
+        self.assertTrue(execute_testsuite(ts_new, reuse=ts_old))
+
+        reused = [t.reused_from for t in ts_new.tests]
+        self.assertEqual(reused, [ts_old.tests[0].output_dir, None])
+        p = os.path.join(ts_new.tests[0].output_dir, Test.perf_fname)
+        self.assertTrue(os.path.isfile(p))
+
+    def test_environment(self):
+        test = make_tests(1, ['0'])[0]
+        env = dict(os.environ)
+        fingerprint = nrtest_execute._fingerprint(test, app, env)
+
+        env['CI_JOB_ID'] = '1234'
+        self.assertEqual(nrtest_execute._fingerprint(test, app, env),
+                         fingerprint)
+        env['LD_LIBRARY_PATH'] = '/opt/lib'
+        self.assertNotEqual(nrtest_execute._fingerprint(test, app, env),
+                            fingerprint)
+
+
+class TestHashCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        os.environ['NRTEST_CACHE_DIR'] = os.path.join(self.path, 'cache')
+        self.input = os.path.join(self.path, 'input.dat')
+        with open(self.input, 'w') as f:
+            f.write('data')
+        nrtest_execute._hash_cache.clear()
+
+    def tearDown(self):
+        del os.environ['NRTEST_CACHE_DIR']
+        rmtree(self.path)
+        nrtest_execute._hash_cache.clear()
+
+    def test_persistent(self):
+        h = nrtest_execute._cached_hash(self.input)
+        cached = os.listdir(os.path.join(self.path, 'cache', 'hashes'))
+        self.assertEqual(len(cached), 1)
+
+        # a later invocation reads the hash from disk
+        p = os.path.join(self.path, 'cache', 'hashes', cached[0])
+        with open(p) as f:
+            record = json.load(f)
+        self.assertEqual(record[-1], h)
+        with open(p, 'w') as f:
+            json.dump(record[:-1] + ['cached'], f)
+        nrtest_execute._hash_cache.clear()
+        self.assertEqual(nrtest_execute._cached_hash(self.input), 'cached')
+
+        # unless the file has changed
+        nrtest_execute._hash_cache.clear()
+        with open(self.input, 'w') as f:
+            f.write('other data')
+        self.assertNotIn(nrtest_execute._cached_hash(self.input),
+                         ['cached', h])
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_merge
+----------------------------------
+
+Tests for merging benchmarks of shards of a TestSuite.
+"""
+
+# system imports
+import os
+import tempfile
+import unittest
+
+# project imports
+from nrtest import Application, Test
+from nrtest.merge import merge_testsuites
+from nrtest.testsuite import TestSuite
+from nrtest.utility import rmtree
+
+
+def make_benchmark(path, names, version='1.0'):
+    app = Application.for_comparison({
+        'name': 'app',
+        'version': version,
+        'description': None,
+    })
+    tests = [Test.for_comparison({
+        'name': name,
+        'version': '1.0',
+        'description': None,
+        'output_files': {'out.txt': 'default'},
+        'passed': True,
+        'error_msg': None,
+    }) for name in names]
+
+    ts = TestSuite(app, tests, path)
+    for t in ts.tests:
+        os.makedirs(t.output_dir)
+        with open(os.path.join(t.output_dir, 'out.txt'), 'w') as f:
+            f.write(t.name)
+    ts.write_manifest()
+
+    return TestSuite.read_benchmark(path)
+
+
+class TestMerge(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmpdir, 'merged')
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def test_merge(self):
+        suites = [make_benchmark(self.path('1'), ['a', 'c']),
+                  make_benchmark(self.path('2'), ['b'])]
+        self.assertIsNotNone(merge_testsuites(suites, self.output))
+
+        ts = TestSuite.read_benchmark(self.output)
+        self.assertEqual([t.name for t in ts.tests], ['a', 'b', 'c'])
+        for t in ts.tests:
+            with open(os.path.join(t.output_dir, 'out.txt')) as f:
+                self.assertEqual(f.read(), t.name)
+
+    def test_duplicate(self):
+        suites = [make_benchmark(self.path('1'), ['a']),
+                  make_benchmark(self.path('2'), ['a'])]
+        self.assertIsNone(merge_testsuites(suites, self.output))
+
+    def test_different_app(self):
+        suites = [make_benchmark(self.path('1'), ['a']),
+                  make_benchmark(self.path('2'), ['b'], version='2.0')]
+        self.assertIsNone(merge_testsuites(suites, self.output))
+        self.assertFalse(os.path.exists(self.output))
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
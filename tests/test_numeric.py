@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_numeric
+----------------------------------
+
+Tests for bundled comparisons of numerical result files.
+"""
+
+# system imports
+import os
+import json
+import tempfile
+import unittest
+
+# third-party imports
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# project imports
+from nrtest.compare import split_file_type
+from nrtest.numeric import numeric_compare, npy_compare, raw_compare
+from nrtest.numeric import DiffStats
+from nrtest.utility import rmtree
+
+
+def passed(result):
+    return result['passed'] if isinstance(result, dict) else result
+
+
+@unittest.skipIf(numpy is None, 'requires numpy')
+class TestNumericCompare(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.ref = self.write('ref.txt', 'x, y\n1.0, 2.0\n3.0, nan\n')
+
+    def tearDown(self):
+        rmtree(self.path)
+
+    def write(self, fname, content):
+        p = os.path.join(self.path, fname)
+        with open(p, 'w') as f:
+            f.write(content)
+        return p
+
+    def compare(self, content, rtol=0.01, atol=0.0, chunk_lines=65536):
+        p = self.write('test.txt', content)
+        return passed(numeric_compare(p, self.ref, rtol, atol,
+                                      chunk_lines=chunk_lines))
+
+    def test_tolerance(self):
+        self.assertTrue(self.compare('x y\n1.005 2.0\n3.0 NaN\n'))
+        self.assertFalse(self.compare('x y\n1.02 2.0\n3.0 NaN\n'))
+        self.assertTrue(self.compare('x y\n1.02 2.0\n3.0 NaN\n', atol=0.05))
+
+    def test_text(self):
+        self.assertFalse(self.compare('x z\n1.0 2.0\n3.0 nan\n'))
+        self.assertFalse(self.compare('x 1.0\n1.0 2.0\n3.0 nan\n'))
+
+    def test_structure(self):
+        self.assertFalse(self.compare('x y\n1.0 2.0 3.0\nnan\n'))
+        self.assertFalse(self.compare('x y\n1.0 2.0\n'))
+        self.assertFalse(self.compare('x y\n1.0 2.0\n3.0 nan\n4.0 5.0\n'))
+
+    def test_chunks(self):
+        rows = ['%i %g' % (i, i * 0.5) for i in range(1000)]
+        self.ref = self.write('ref.txt', '\n'.join(rows))
+        self.assertTrue(self.compare('\n'.join(rows), chunk_lines=64))
+
+        rows[-1] = '999 0'
+        self.assertFalse(self.compare('\n'.join(rows), chunk_lines=64))
+
+
+@unittest.skipIf(numpy is None, 'requires numpy')
+class TestBinaryCompare(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.ref = numpy.linspace(0.0, 1.0, 1000).reshape(100, 10)
+        self.ref[3, 4] = numpy.nan
+
+    def tearDown(self):
+        rmtree(self.path)
+
+    def save(self, fname, a):
+        p = os.path.join(self.path, fname)
+        if fname.endswith('.npy'):
+            numpy.save(p, a)
+        else:
+            a.tofile(p)
+        return p
+
+    def test_npy(self):
+        def compare(test, rtol, **kwargs):
+            return passed(npy_compare(test, ref, rtol, 0.0, **kwargs))
+
+        ref = self.save('ref.npy', self.ref)
+        test = self.save('test.npy', self.ref * 1.005)
+        self.assertTrue(compare(test, 0.01, block_size=64))
+        self.assertFalse(compare(test, 0.001, block_size=64))
+        self.assertRaises(ValueError, compare, test, 0.01, spec='<f8')
+
+        # layout and type of the arrays do not matter
+        test = self.save('test.npy', numpy.asfortranarray(self.ref, 'f4'))
+        self.assertTrue(compare(test, 1e-6, block_size=64))
+
+        test = self.save('test.npy', self.ref.T)
+        self.assertFalse(compare(test, 0.01))
+
+    def test_raw(self):
+        ref = self.save('ref.bin', self.ref.astype('<f4'))
+        test = self.save('test.bin', self.ref.astype('<f4') + 0.002)
+        self.assertTrue(passed(raw_compare(test, ref, 0.0, 0.01, '<f4', 64)))
+        self.assertFalse(passed(raw_compare(test, ref, 0.0, 0.001, '<f4', 64)))
+
+        test = self.save('test.bin', self.ref[:50].astype('<f4'))
+        self.assertFalse(passed(raw_compare(test, ref, 0.0, 0.01, '<f4')))
+
+        odd = self.save('odd.bin', numpy.zeros(999, '<f4'))
+        self.assertRaises(ValueError, raw_compare, odd, odd, 0.0, 0.0, '<f8')
+
+        empty = self.save('empty.bin', numpy.zeros(0))
+        self.assertTrue(passed(raw_compare(empty, empty, 0.0, 0.0)))
+
+    def test_stats(self):
+        ref = self.save('ref.npy', self.ref)
+        a = self.ref.copy()
+        a[2, 5] += 0.5
+        a[7, 1] += 0.02
+        a[3, 4] = 1.0
+        test = self.save('test.npy', a)
+
+        stats = npy_compare(test, ref, 0.0, 0.01, block_size=64)
+        self.assertFalse(stats['passed'])
+        self.assertEqual(stats['failed'], 3)
+        self.assertAlmostEqual(stats['max_abs_error'], 0.5)
+        self.assertEqual(stats['max_abs_error_at'], [2, 5])
+        self.assertEqual(sum(stats['histogram']['counts']), self.ref.size)
+        self.assertEqual(stats['histogram']['counts'][-1], 1)
+
+    def test_file_type(self):
+        self.assertEqual(split_file_type('Raw:<f4'), ('raw', '<f4'))
+        self.assertEqual(split_file_type('npy'), ('npy', None))
+
+
+class TestDiffStats(unittest.TestCase):
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_blocks(self):
+        stats = DiffStats(0.1, 0.0)
+        stats.add(numpy.array([1.0, 2.0]), numpy.array([1.0, 1.9]),
+                  offset=10)
+        stats.add(numpy.array([0.0, numpy.nan, numpy.inf]),
+                  numpy.array([1.0, numpy.nan, numpy.inf]),
+                  locations=numpy.array([5, 6, 7]))
+        result = stats.result()
+
+        self.assertFalse(result['passed'])
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual(result['max_abs_error'], 1.0)
+        self.assertEqual(result['max_abs_error_at'], 5)
+        self.assertAlmostEqual(result['max_rel_error'], 1.0)
+        self.assertEqual(result['max_rel_error_at'], 5)
+        self.assertEqual(result['histogram']['counts'],
+                         [3, 0, 0, 1, 1, 0, 0, 0])
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_infinities(self):
+        inf, nan = numpy.inf, numpy.nan
+        pairs = [(1.0, inf, False), (-inf, inf, False), (inf, -inf, False),
+                 (nan, inf, False), (inf, inf, True), (-inf, -inf, True),
+                 (nan, nan, True)]
+        for a, b, expected in pairs:
+            stats = DiffStats(1e-6, 0.0)
+            stats.add(numpy.array([a]), numpy.array([b]))
+            self.assertEqual(stats.result()['passed'], expected, (a, b))
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_finite(self):
+        stats = DiffStats(0.0, 1e-3)
+        stats.add(numpy.array([1e-4, 1.0]), numpy.array([0.0, numpy.inf]))
+        result = stats.result()
+        self.assertFalse(result['passed'])
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual(result['max_abs_error'], 1e-4)
+        self.assertEqual(result['max_rel_error'], 0.0)
+        json.dumps(result, allow_nan=False)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
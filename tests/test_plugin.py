@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_plugin
+----------------------------------
+
+Tests for discovery of plugins.
+"""
+
+# system imports
+import os
+import sys
+import tempfile
+import unittest
+
+# project imports
+from nrtest import plugin
+from nrtest.utility import rmtree
+
+
+def make_distribution(path, name, entry_points):
+    """Creates an installed distribution that registers compare functions."""
+    d = os.path.join(path, '%s-1.0.dist-info' % name)
+    os.makedirs(d)
+    with open(os.path.join(d, 'METADATA'), 'w') as f:
+        f.write('Metadata-Version: 2.1\nName: %s\nVersion: 1.0\n' % name)
+    with open(os.path.join(d, 'entry_points.txt'), 'w') as f:
+        f.write('[nrtest.compare]\n')
+        for ep in entry_points:
+            f.write('%s = %s:compare\n' % (ep, name))
+
+    with open(os.path.join(path, name + '.py'), 'w') as f:
+        f.write('def compare(path_test, path_ref, rtol, atol):\n'
+                '    return True\n')
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        make_distribution(self.path, 'fake_one', ['fake', 'dup'])
+        make_distribution(self.path, 'fake_two', ['dup'])
+        sys.path.insert(0, self.path)
+
+        plugin._entry_points.clear()
+        plugin._functions.clear()
+
+    def tearDown(self):
+        sys.path.remove(self.path)
+        rmtree(self.path)
+        plugin._entry_points.clear()
+        plugin._functions.clear()
+
+    def test_find(self):
+        func = plugin.find_unique_function('compare', 'fake')
+        self.assertEqual(func.__module__, 'fake_one')
+        self.assertIs(plugin.find_unique_function('compare', 'fake'), func)
+        self.assertIsNone(plugin.find_unique_function('compare', 'dup'))
+        self.assertIsNone(plugin.find_unique_function('compare', 'missing'))
+
+    def test_prime(self):
+        functions = plugin.prime('compare')
+        self.assertEqual(functions['fake'].__module__, 'fake_one')
+        self.assertIsNone(functions['dup'])
+
+        target, dist = plugin.describe(plugin.registry('compare')['fake'][0])
+        self.assertEqual(target, 'fake_one:compare')
+        self.assertIn('fake', dist)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
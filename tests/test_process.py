@@ -11,11 +11,18 @@ Tests for process management.
 # system imports
 import unittest
 import os
+import sys
+import time
+import threading
 from subprocess import check_output
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp
+
+# third-party imports
+import psutil
 
 # project imports
-from nrtest.process import source, execute, monitor
+from nrtest.process import source, cached_source, execute, monitor
+from nrtest.utility import rmtree
 
 
 class TestProcess(unittest.TestCase):
@@ -33,6 +40,84 @@ class TestProcess(unittest.TestCase):
         os.remove(script_name)
         self.assertEqual(stdout.strip(), var_value)
 
+    def test_cached_source(self):
+        cache_path = mkdtemp()
+        os.environ['NRTEST_CACHE_DIR'] = cache_path
+        with NamedTemporaryFile('w', delete=False) as f:
+            f.write('export TESTVAR=1')
+            script_name = f.name
+
+        env1 = cached_source(script_name)
+        with open(script_name, 'w') as f:
+            f.write('export TESTVAR=2')
+        env2 = cached_source(script_name)
+        env3 = cached_source(script_name)
+        env_dir = os.path.join(cache_path, 'env')
+        paths = [env_dir] + [os.path.join(env_dir, f)
+                             for f in os.listdir(env_dir)]
+        modes = [os.stat(p).st_mode & 0o777 for p in paths]
+        n_cached = len(paths) - 1
+
+        os.remove(script_name)
+        rmtree(cache_path)
+        del os.environ['NRTEST_CACHE_DIR']
+        self.assertEqual(n_cached, 2)
+        self.assertEqual(modes, [0o700, 0o600, 0o600])
+        self.assertEqual(env1['TESTVAR'], '1')
+        self.assertEqual(env2['TESTVAR'], '2')
+        self.assertEqual(env2, env3)
+
+    def test_concurrent(self):
+        results = []
+
+        def run(cmd):
+            results.append(monitor(execute(cmd)))
+
+        threads = [threading.Thread(target=run, args=('sleep 1',))
+                   for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for exit_code, perf in results:
+            self.assertEqual(exit_code, 0)
+            self.assertAlmostEqual(perf['duration'], 1.0, delta=0.3)
+            self.assertGreater(len(perf['samples']['time']), 5)
+
+    def test_process_tree(self):
+        alloc = '%s -c "x = bytearray(50 * 2**20); import time; ' \
+                'time.sleep(1)"' % sys.executable
+        p = execute(['/bin/bash', '-c', '%s & %s & wait' % (alloc, alloc)])
+        (_, perf) = monitor(p)
+
+        self.assertEqual(len(perf['processes']), 3)
+        self.assertGreater(perf['max_memory_MB'], 100)
+
+    def test_timeout_kills_tree(self):
+        p = execute(['/bin/bash', '-c', 'sleep 5 & sleep 5 & wait'])
+        time.sleep(0.5)
+        children = p.children()
+        (_, perf) = monitor(p, timeout=1)
+
+        self.assertIsNone(perf['duration'])
+        for c in children:
+            self.assertTrue(not c.is_running() or
+                            c.status() == psutil.STATUS_ZOMBIE)
+
+    def test_short(self):
+        p = execute([sys.executable, '-c', 'x = bytearray(50 * 2**20)'])
+        (_, perf) = monitor(p, dt=10)
+
+        self.assertGreater(perf['max_memory_MB'], 50)
+
+    def test_bounded(self):
+        p = execute('sleep 1')
+        (_, perf) = monitor(p, dt=0.01, max_ndata=10)
+
+        self.assertLessEqual(len(perf['samples']['time']), 10)
+        self.assertGreater(perf['summary']['memory_MB']['n'], 50)
+
     def test_timeout(self):
         p = execute('sleep 5')
         (_, perf) = monitor(p, timeout=2)
@@ -42,5 +127,4 @@ class TestProcess(unittest.TestCase):
 
 
 if __name__ == '__main__':
-    import sys
     sys.exit(unittest.main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_schedule
+----------------------------------
+
+Tests for scheduling the execution of tests.
+"""
+
+# system imports
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+# project imports
+from nrtest import Test
+from nrtest.schedule import read_history, order_tests, run_concurrently
+from nrtest.schedule import shard_tests
+from nrtest.utility import rmtree
+
+
+def make_test(name):
+    return Test.for_execution({'name': name, 'version': '1.0', 'args': []})
+
+
+class TestOrder(unittest.TestCase):
+    def setUp(self):
+        self.tests = [make_test(name) for name in 'abcde']
+        self.history = {
+            'a': {'duration': 1.0},
+            'b': {'duration': 5.0},
+            'd': {'duration': 3.0},
+            'e': {'duration': None},
+        }
+
+    def test_longest_first(self):
+        ordered = order_tests(self.tests, self.history)
+        self.assertEqual([t.name for t in ordered], ['c', 'e', 'b', 'd', 'a'])
+
+    def test_no_history(self):
+        ordered = order_tests(self.tests, {})
+        self.assertEqual([t.name for t in ordered], list('abcde'))
+
+
+class TestShard(unittest.TestCase):
+    def setUp(self):
+        self.tests = [make_test(name) for name in 'abcde']
+        self.history = {
+            'a': {'duration': 8.0},
+            'b': {'duration': 5.0},
+            'c': {'duration': 4.0},
+            'd': {'duration': 3.0},
+        }
+
+    def shards(self, count, history):
+        return [[t.name for t in shard_tests(self.tests, history, i, count)]
+                for i in range(count)]
+
+    def test_balanced(self):
+        self.assertEqual(self.shards(2, self.history),
+                         [['a', 'c'], ['b', 'd', 'e']])
+
+    def test_partition(self):
+        for count in [1, 3, 7]:
+            shards = self.shards(count, {})
+            self.assertEqual(sorted(sum(shards, [])), list('abcde'))
+            self.assertLessEqual(max(map(len, shards)), 5 // count + 1)
+
+
+class TestRunConcurrently(unittest.TestCase):
+    def setUp(self):
+        self.tests = [make_test(name) for name in 'abcd']
+        self.memory = {'a': 600, 'b': 600, 'c': 100, 'd': 100}
+        self.lock = threading.Lock()
+        self.running = []
+        self.peaks = []
+
+    def func(self, test):
+        with self.lock:
+            self.running.append(test.name)
+            self.peaks.append(sum(self.memory[n] for n in self.running))
+        time.sleep(0.2)
+        with self.lock:
+            self.running.remove(test.name)
+        return test.name
+
+    def test_memory_limit(self):
+        results = run_concurrently(self.func, self.tests, jobs=4,
+                                   memory_limit=1000, memory=self.memory)
+        self.assertEqual(sorted(results), list('abcd'))
+        self.assertLessEqual(max(self.peaks), 1000)
+        self.assertEqual(results[-1], 'b')
+
+    def test_oversized(self):
+        results = run_concurrently(self.func, self.tests, jobs=4,
+                                   memory_limit=500, memory=self.memory)
+        self.assertEqual(sorted(results), list('abcd'))
+        self.assertLessEqual(max(self.peaks), 600)
+
+    def test_exception(self):
+        def func(test):
+            raise RuntimeError(test.name)
+
+        with self.assertRaises(RuntimeError):
+            run_concurrently(func, self.tests, jobs=2)
+
+
+class TestReadHistory(unittest.TestCase):
+    def setUp(self):
+        self.benchmark_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.benchmark_path)
+
+    def test_read(self):
+        os.makedirs(os.path.join(self.benchmark_path, 'a'))
+        p = os.path.join(self.benchmark_path, 'a', Test.perf_fname)
+        with open(p, 'w') as f:
+            json.dump({'duration': 2.0}, f)
+
+        history = read_history(self.benchmark_path, [make_test('a'),
+                                                     make_test('b')])
+        self.assertEqual(history, {'a': {'duration': 2.0}})
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
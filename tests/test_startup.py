@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_startup
+----------------------------------
+
+Tests that the command-line interface starts quickly, by checking that slow
+modules are not imported until they are needed.
+"""
+
+# system imports
+import os
+import subprocess
+import sys
+import unittest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that take a long time to import
+slow_modules = ['pkg_resources', 'multiprocessing.pool', 'numpy']
+
+
+def imported_modules(code):
+    """Returns the cumulative import time [us] of each module imported by a
+    Python snippet, as reported by the -X importtime option.
+    """
+    env = dict(os.environ, PYTHONPATH=root)
+    cmd = [sys.executable, '-X', 'importtime', '-c', code]
+    p = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, universal_newlines=True)
+    _, stderr = p.communicate()
+
+    modules = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'requires -X importtime')
+class TestStartup(unittest.TestCase):
+    def test_cli_imports(self):
+        modules = imported_modules('import nrtest.testsuite, nrtest.compare, '
+                                   'nrtest.merge, nrtest.plugin')
+        self.assertIn('nrtest.compare', modules)
+        for name in slow_modules:
+            self.assertNotIn(name, modules)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_stats
+----------------------------------
+
+Tests for streaming statistics of performance data.
+"""
+
+# system imports
+import random
+import unittest
+
+# project imports
+from nrtest.stats import percentile, Quantile, Summary, Series
+
+
+class TestQuantile(unittest.TestCase):
+    def test_percentile(self):
+        self.assertEqual(percentile([3, 1, 2], 0.5), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2.5)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_small(self):
+        q = Quantile(0.5)
+        for x in [5, 1, 3]:
+            q.add(x)
+        self.assertEqual(q.value(), 3)
+
+    def test_estimate(self):
+        rng = random.Random(0)
+        values = [rng.gauss(100, 10) for _ in range(10000)]
+
+        for p in [0.5, 0.9, 0.99]:
+            q = Quantile(p)
+            for x in values:
+                q.add(x)
+            self.assertAlmostEqual(q.value(), percentile(values, p), delta=1)
+
+    def test_summary(self):
+        s = Summary()
+        for x in range(1, 101):
+            s.add(x)
+        d = s.to_dict()
+
+        self.assertEqual((d['n'], d['min'], d['max']), (100, 1, 100))
+        self.assertAlmostEqual(d['mean'], 50.5)
+        self.assertAlmostEqual(d['p50'], 50.5, delta=1)
+
+
+class TestSeries(unittest.TestCase):
+    def test_bounded(self):
+        series = Series(capacity=10)
+        for i in range(1000):
+            series.add({'time': i})
+
+        times = series.to_dict()['time']
+        self.assertLessEqual(len(series), 10)
+        self.assertEqual(times[0], 0)
+        self.assertGreater(times[-1], 800)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
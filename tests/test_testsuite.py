@@ -5,16 +5,17 @@
 test_testsuite
 ----------------------------------
 
-Tests for validation of TestSuite.
+Tests for validation and benchmarks of TestSuite.
 """
 
+import json
 import os.path
 import tempfile
 import unittest
 
 from nrtest import Application, Test
 from nrtest.execute import validate_testsuite
-from nrtest.testsuite import TestSuite
+from nrtest.testsuite import TestSuite, find_configs, read_configs
 from nrtest.utility import rmtree
 
 app1 = Application.for_execution({
@@ -43,6 +44,136 @@ test2 = Test.for_execution({
 })
 
 
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.benchmark_path = tempfile.mkdtemp()
+        self.app = Application.for_comparison({
+            'name': 'app',
+            'version': '1.0',
+            'description': None,
+        })
+        self.records = [{
+            'name': name,
+            'version': '1.0',
+            'description': None,
+            'output_files': {},
+            'passed': True,
+            'error_msg': None,
+        } for name in ['sweep "1"', 'sweep "2"', 'other']]
+
+    def tearDown(self):
+        rmtree(self.benchmark_path)
+
+    def names(self, pattern=None):
+        ts = TestSuite.read_benchmark(self.benchmark_path, pattern)
+        return [t.name for t in ts.tests]
+
+    def test_jsonl(self):
+        tests = [Test.for_comparison(dict(r)) for r in self.records]
+        TestSuite(self.app, tests, self.benchmark_path).write_manifest()
+
+        p = os.path.join(self.benchmark_path, TestSuite.manifest_fname)
+        with open(p) as f:
+            self.assertEqual(len(f.readlines()), 4)
+
+        self.assertEqual(self.names(), ['other', 'sweep "1"', 'sweep "2"'])
+        self.assertEqual(self.names('sweep*'), ['sweep "1"', 'sweep "2"'])
+
+    def test_legacy(self):
+        manifest = {'Application': self.app, 'Tests': self.records}
+        p = os.path.join(self.benchmark_path, 'manifest.json')
+        with open(p, 'w') as f:
+            json.dump(manifest, f)
+
+        self.assertEqual(self.names(), ['other', 'sweep "1"', 'sweep "2"'])
+        self.assertEqual(self.names('*"2"'), ['sweep "2"'])
+
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache_path = tempfile.mkdtemp()
+        os.environ['NRTEST_CACHE_DIR'] = self.cache_path
+
+        for d in ['a', os.path.join('a', 'b')]:
+            os.mkdir(os.path.join(self.root, d))
+        self.paths = [os.path.join(self.root, p)
+                      for p in ['top.json', 'a/one.json', 'a/b/two.json']]
+        for p in self.paths:
+            self.write(p, 1)
+        self.write(os.path.join(self.root, 'notes.txt'), 0)
+
+    def tearDown(self):
+        rmtree(self.root)
+        rmtree(self.cache_path)
+        del os.environ['NRTEST_CACHE_DIR']
+
+    def write(self, p, value):
+        with open(p, 'w') as f:
+            json.dump({'value': value}, f)
+
+    def test_find(self):
+        self.assertEqual(find_configs([self.root]), [self.paths[0]])
+        self.assertEqual(find_configs([self.root, self.paths[0]],
+                                      recursive=True), sorted(self.paths))
+
+    def test_symlinks(self):
+        os.symlink('..', os.path.join(self.root, 'a', 'b', 'up'))
+        os.symlink('a', os.path.join(self.root, 'link'))
+        self.assertEqual(find_configs([self.root], recursive=True),
+                         sorted(self.paths))
+
+    def test_index(self):
+        self.assertEqual(read_configs(self.paths), [{'value': 1}] * 3)
+
+        # unchanged files are read from the index
+        st = os.stat(self.paths[0])
+        self.write(self.paths[0], 2)
+        os.utime(self.paths[0], ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(read_configs(self.paths)[0], {'value': 1})
+
+        os.utime(self.paths[0], (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(read_configs(self.paths)[0], {'value': 2})
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.benchmark_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.benchmark_path)
+
+    def test_read_journal(self):
+        test = Test.for_execution({'name': 'cat', 'version': '1.0',
+                                   'args': []})
+        ts = TestSuite(app1, [test], self.benchmark_path)
+        test.passed = True
+        ts.append_journal(test)
+
+        # simulate an interruption whilst writing a record
+        p = os.path.join(self.benchmark_path, TestSuite.journal_fname)
+        with open(p, 'a') as f:
+            f.write('{"name": "dog", "pass')
+
+        records = ts.read_journal()
+        self.assertEqual(list(records.keys()), ['cat'])
+        self.assertTrue(records['cat']['passed'])
+
+        # the record of the test finished after resuming is not lost
+        dog = Test.for_execution({'name': 'dog', 'version': '1.0',
+                                  'args': []})
+        dog.passed = False
+        ts.append_journal(dog)
+        records = ts.read_journal()
+        self.assertEqual(sorted(records), ['cat', 'dog'])
+        self.assertFalse(records['dog']['passed'])
+
+    def test_resume(self):
+        ts = TestSuite(app1, [test1], self.benchmark_path)
+        self.assertFalse(validate_testsuite(ts))
+        self.assertTrue(validate_testsuite(ts, resume=True))
+
+
 class TestMinimumAppVersion(unittest.TestCase):
     def setUp(self):
         self.benchmark_path = os.path.join(tempfile.gettempdir(), "benchmark")
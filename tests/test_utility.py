@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_utility
+----------------------------------
+
+Tests for file handling utilities.
+"""
+
+# system imports
+import os
+import tempfile
+import unittest
+
+# project imports
+from nrtest.utility import stage_file, move_file_and_path, copy_file, rmtree
+
+
+class FileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.src_dir = tempfile.mkdtemp()
+        self.dest = tempfile.mkdtemp()
+        self.rel_path = os.path.join('subdir', 'input.txt')
+
+        os.makedirs(os.path.join(self.src_dir, 'subdir'))
+        with open(os.path.join(self.src_dir, self.rel_path), 'w') as f:
+            f.write('input data')
+
+    def tearDown(self):
+        rmtree(self.src_dir)
+        rmtree(self.dest)
+
+
+class TestStageFile(FileTestCase):
+    def stage(self, method):
+        used = stage_file(self.rel_path, self.src_dir, self.dest, method)
+        p = os.path.join(self.dest, self.rel_path)
+        with open(p) as f:
+            self.assertEqual(f.read(), 'input data')
+        return used, p
+
+    def test_copy(self):
+        used, p = self.stage('copy')
+        self.assertEqual(used, 'copy')
+        self.assertFalse(os.path.islink(p))
+
+    def test_reflink(self):
+        used, _ = self.stage('reflink')
+        self.assertIn(used, ['reflink', 'copy'])
+
+    def test_hardlink(self):
+        used, p = self.stage('hardlink')
+        self.assertEqual(used, 'hardlink')
+        src = os.path.join(self.src_dir, self.rel_path)
+        self.assertTrue(os.path.samefile(src, p))
+
+    def test_symlink(self):
+        used, p = self.stage('symlink')
+        self.assertEqual(used, 'symlink')
+        self.assertTrue(os.path.islink(p))
+
+
+class TestMoveFile(FileTestCase):
+    def test_move(self):
+        move_file_and_path(self.rel_path, self.src_dir, self.dest)
+        self.assertFalse(os.path.exists(os.path.join(self.src_dir,
+                                                     self.rel_path)))
+        with open(os.path.join(self.dest, self.rel_path)) as f:
+            self.assertEqual(f.read(), 'input data')
+
+    def test_copy_large(self):
+        src = os.path.join(self.src_dir, 'large.bin')
+        dst = os.path.join(self.dest, 'large.bin')
+        data = os.urandom(2 ** 24 + 7)
+        with open(src, 'wb') as f:
+            f.write(data)
+
+        copy_file(src, dst)
+        with open(dst, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())